@@ -0,0 +1,149 @@
+from array import array
+from collections import *
+from itertools import *
+
+# Letters as a structure of arrays. An actor is a stable integer id that
+# indexes every column: the letter code, the radius, the state, the body with
+# its spring and sprite, and the position and angle saved at the last tick.
+# The ids in use are kept in a dense list, so that iteration skips free ids,
+# and a removed id is swapped with the last one. Up to pool size free ids
+# are kept with their hidden sprites for reuse. The sprites of the ids
+# freed beyond that are deleted, and those ids are reused without a sprite
+# before new ones are added. The counters tell whether the pool pays off.
+# Live letters are counted, in total and per letter, and the live actors of
+# every letter are kept in a dense list of their own, as are the destroyed
+# actors, with a swap on removal, as they come and go.
+
+FREE = 0
+LIVE = 1
+DESTROYED = 2
+
+class ActorStore(object):
+    def __init__(self, pool_size):
+        self.pool_size = pool_size
+        self.codes = array('i')
+        self.radii = array('d')
+        self.states = array('b')
+        self.xs = array('d')
+        self.ys = array('d')
+        self.angles = array('d')
+        self.bodies = []
+        self.springs = []
+        self.sprites = []
+        self.ids = []
+        self.live_count = 0
+        self.letter_counts = defaultdict(int)
+        self.letter_ids = defaultdict(list)
+        self.destroyed_ids = []
+        self.hits = 0
+        self.misses = 0
+        self.discards = 0
+        self._indices = array('i')
+        self._group_indices = array('i')
+        self._free_ids = []
+        self._spare_ids = []
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __iter__(self):
+        return iter(self.ids)
+
+    @property
+    def hit_rate(self):
+        return float(self.hits) / max(self.hits + self.misses, 1)
+
+    def count(self, letter):
+        return self.letter_counts.get(letter, 0)
+
+    def get_letter(self, actor):
+        code = self.codes[actor]
+        return unichr(code) if code >= 0 else None
+
+    def add(self, letter, radius, body, x=0., y=0., angle=0.):
+        if self._free_ids:
+            actor = self._free_ids.pop()
+            self.hits += 1
+        elif self._spare_ids:
+            actor = self._spare_ids.pop()
+            self.misses += 1
+        else:
+            self.misses += 1
+            actor = len(self.states)
+            for column in (self.codes, self._indices, self._group_indices):
+                column.append(-1)
+            for column in (self.radii, self.xs, self.ys, self.angles):
+                column.append(0.)
+            self.states.append(FREE)
+            for column in (self.bodies, self.springs, self.sprites):
+                column.append(None)
+        self.codes[actor] = ord(letter)
+        self.radii[actor] = radius
+        self.states[actor] = LIVE
+        self.bodies[actor] = body
+        self.xs[actor] = x
+        self.ys[actor] = y
+        self.angles[actor] = angle
+        _append_id(self.ids, self._indices, actor)
+        self.live_count += 1
+        self.letter_counts[letter] += 1
+        _append_id(self.letter_ids[letter], self._group_indices, actor)
+        return actor
+
+    # Takes the letter from a live actor, which stays in the store until it
+    # is removed.
+    def destroy(self, actor):
+        if self.states[actor] == LIVE:
+            letter = self.get_letter(actor)
+            self.letter_counts[letter] -= 1
+            _remove_id(self.letter_ids[letter], self._group_indices, actor)
+            _append_id(self.destroyed_ids, self._group_indices, actor)
+            self.live_count -= 1
+            self.states[actor] = DESTROYED
+            self.codes[actor] = -1
+
+    # Destroys every live actor at once, without visiting the destroyed
+    # ones. Returns the destroyed actors.
+    def destroy_all(self):
+        states = self.states
+        codes = self.codes
+        actors = list(chain(*self.letter_ids.itervalues()))
+        for actor in actors:
+            states[actor] = DESTROYED
+            codes[actor] = -1
+            _append_id(self.destroyed_ids, self._group_indices, actor)
+        self.live_count = 0
+        self.letter_counts.clear()
+        self.letter_ids.clear()
+        return actors
+
+    # The sprite is kept for the next actor with the same id, unless the pool
+    # is full.
+    def remove(self, actor):
+        self.destroy(actor)
+        _remove_id(self.destroyed_ids, self._group_indices, actor)
+        _remove_id(self.ids, self._indices, actor)
+        self.states[actor] = FREE
+        self.bodies[actor] = None
+        self.springs[actor] = None
+        if len(self._free_ids) < self.pool_size:
+            self._free_ids.append(actor)
+        else:
+            self.discards += 1
+            if self.sprites[actor] is not None:
+                self.sprites[actor].delete()
+                self.sprites[actor] = None
+            self._spare_ids.append(actor)
+
+def _append_id(ids, indices, actor):
+    indices[actor] = len(ids)
+    ids.append(actor)
+
+# Moves the last id into the place of the removed one.
+def _remove_id(ids, indices, actor):
+    index = indices[actor]
+    last = ids.pop()
+    if last != actor:
+        ids[index] = last
+        indices[last] = index
+    indices[actor] = -1
@@ -0,0 +1,69 @@
+from __future__ import with_statement
+
+import cPickle as pickle
+from math import *
+import os
+import pyglet
+
+# All letters of the alphabet rasterized into one alpha texture, with the
+# anchors of every glyph at its center, so that letter sprites share a
+# single texture and sprite group. The rasterized pixels are cached on disk,
+# keyed by the font, size and alphabet, so that later launches skip the
+# font rasterizer.
+
+# Bump when the cache layout changes.
+format_version = 1
+
+class GlyphAtlas(object):
+    def __init__(self, width, height, data, regions):
+        image_data = pyglet.image.ImageData(width, height, 'A', data)
+        self.texture = image_data.get_texture()
+        self.glyphs = {}
+        for letter, (x, y, glyph_width, glyph_height) in regions.iteritems():
+            glyph = self.texture.get_region(x, y, glyph_width, glyph_height)
+            glyph.anchor_x = glyph_width // 2
+            glyph.anchor_y = glyph_height // 2
+            self.glyphs[letter] = glyph
+
+def load_glyph_atlas(path, font_name, font_size, bold, alphabet):
+    key = (format_version, pyglet.version, font_name, float(font_size),
+           bool(bold), alphabet)
+    if path is not None and os.path.exists(path):
+        try:
+            with open(path, 'rb') as atlas_file:
+                cached_key, atlas_args = pickle.load(atlas_file)
+        except (EnvironmentError, pickle.UnpicklingError, EOFError,
+                ValueError):
+            cached_key = None
+        if cached_key == key:
+            return GlyphAtlas(*atlas_args)
+    atlas_args = rasterize_glyphs(font_name, font_size, bold, alphabet)
+    if path is not None:
+        with open(path, 'wb') as atlas_file:
+            pickle.dump((key, atlas_args), atlas_file,
+                        pickle.HIGHEST_PROTOCOL)
+    return GlyphAtlas(*atlas_args)
+
+# Copies the alpha of every glyph into a grid of equal cells with a pixel of
+# padding, so that filtering never bleeds between glyphs.
+def rasterize_glyphs(font_name, font_size, bold, alphabet, padding=1):
+    font = pyglet.font.load(font_name, font_size, bold=bold)
+    images = [glyph.get_image_data() for glyph in font.get_glyphs(alphabet)]
+    cell_width = max(image.width for image in images) + 2 * padding
+    cell_height = max(image.height for image in images) + 2 * padding
+    columns = int(ceil(sqrt(len(images))))
+    rows = (len(images) + columns - 1) // columns
+    width = columns * cell_width
+    height = rows * cell_height
+    data = bytearray(width * height)
+    regions = {}
+    for i, (letter, image) in enumerate(zip(alphabet, images)):
+        x = (i % columns) * cell_width + padding
+        y = (i // columns) * cell_height + padding
+        pixels = image.get_data('A', image.width)
+        for row in xrange(image.height):
+            row_pixels = pixels[row * image.width:(row + 1) * image.width]
+            offset = (y + row) * width + x
+            data[offset:offset + image.width] = row_pixels
+        regions[letter] = x, y, image.width, image.height
+    return width, height, str(data), regions
@@ -0,0 +1,614 @@
+from __future__ import with_statement
+
+from actors import ActorStore
+import config
+from game import (Game, apply_destroy_forces, apply_spring_forces,
+                  create_center_spring, create_letter_body, create_world,
+                  require_data_dir)
+from profiler import percentile
+from solver import Solver
+from wordindex import WordIndex, word_list_checksum
+import codecs
+from collections import *
+from contextlib import contextmanager
+from itertools import *
+import cPickle as pickle
+import gc
+from math import *
+from optparse import OptionParser
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+# Reference implementation: the dict-of-dicts letter tree that WordIndex
+# used before it was compacted into a DAWG.
+class DictWordIndex(object):
+    def __init__(self, words):
+        self.letter_tree = {}
+        for word in words:
+            self.add_word(word)
+
+    def add_word(self, word):
+        tree = self.letter_tree
+        for letter in word:
+            tree = tree.setdefault(letter, {})
+        tree[u''] = None
+
+    def complete(self, prefix):
+        tree = self.letter_tree
+        for letter in prefix:
+            if letter in tree:
+                tree = tree[letter]
+            else:
+                return set()
+        return set(tree)
+
+# Reference implementation of the linear scan that random_letter used.
+def scan_random_letter(letter_counts):
+    total_count = sum(letter_counts.values())
+    random_count = random.randrange(total_count)
+    for letter, count in letter_counts.items():
+        if random_count < count:
+            return letter
+        random_count -= count
+    return None
+
+def read_words(path, encoding=config.word_list_encoding):
+    alphabet = set(config.alphabet)
+    words = []
+    with codecs.open(path, 'r', encoding) as file_obj:
+        for line in file_obj:
+            word = line.strip().upper()
+            if word and not set(word) - alphabet:
+                words.append(word)
+    return words
+
+def tree_size(tree):
+    size = 0
+    stack = [tree]
+    while stack:
+        tree = stack.pop()
+        size += sys.getsizeof(tree)
+        for key, value in tree.iteritems():
+            size += sys.getsizeof(key)
+            if value is not None:
+                stack.append(value)
+    return size
+
+def word_index_size(word_index):
+    word_index.node_count
+    return sum(sys.getsizeof(obj) for obj in (word_index._edge_offsets,
+                                               word_index._edge_letters,
+                                               word_index._edge_targets,
+                                               word_index._terminals))
+
+def sample_prefixes(words, count, seed=0):
+    rng = random.Random(seed)
+    prefixes = []
+    for _ in xrange(count):
+        word = rng.choice(words)
+        prefix = word[:rng.randint(1, len(word))]
+        if rng.random() < 0.25:
+            prefix += rng.choice(config.alphabet)
+        prefixes.append(prefix)
+    return prefixes
+
+def time_calls(func, args, repeat=3):
+    best = None
+    for _ in xrange(repeat):
+        start = time.time()
+        for arg in args:
+            func(arg)
+        elapsed = time.time() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best
+
+def time_build(factory, words):
+    gc.collect()
+    start = time.time()
+    index = factory(words)
+    return index, time.time() - start
+
+def bench_word_index(words, lookup_count=100000):
+    prefixes = sample_prefixes(words, lookup_count)
+    dict_index, dict_build = time_build(DictWordIndex, words)
+    dawg_index, dawg_build = time_build(
+        lambda words: WordIndex(words, cache_size=0), words)
+    for prefix in prefixes[:1000]:
+        assert dict_index.complete(prefix) == dawg_index.complete(prefix)
+    print 'Word index (%d words, %d lookups)' % (len(words), len(prefixes))
+    print '  %-12s %12s %12s %12s' % ('', 'memory (kB)', 'build (s)',
+                                      'lookup (us)')
+    for name, index, size, build in (
+        ('dict tree', dict_index, tree_size(dict_index.letter_tree),
+         dict_build),
+        ('dawg', dawg_index, word_index_size(dawg_index), dawg_build)):
+        lookup = time_calls(index.complete, prefixes)
+        print '  %-12s %12d %12.3f %12.3f' % (name, size // 1024, build,
+                                              1e6 * lookup / len(prefixes))
+    print '  dawg nodes: %d' % dawg_index.node_count
+
+# Typed prefixes as a caller that queries every frame sees them: every
+# prefix of each word is queried for a number of frames before the next
+# letter is typed.
+def sample_typed_prefixes(words, word_count, frame_count=10, seed=0):
+    rng = random.Random(seed)
+    prefixes = []
+    for _ in xrange(word_count):
+        word = rng.choice(words)
+        for i in xrange(1, len(word) + 1):
+            prefixes.extend([word[:i]] * frame_count)
+    return prefixes
+
+def bench_completion_cache(words, word_count=10000):
+    prefixes = sample_typed_prefixes(words, word_count)
+    print 'Completion cache (%d lookups)' % len(prefixes)
+    print '  %-8s %12s %10s %10s %10s' % ('size', 'lookup (us)', 'hits',
+                                          'misses', 'evictions')
+    for cache_size in sorted(set((0, 64, 256, 1024, 4096,
+                                  config.completion_cache_size))):
+        word_index = WordIndex(words, cache_size=cache_size)
+        lookup = time_calls(word_index.complete, prefixes, repeat=1)
+        cache = word_index.completion_cache
+        if cache is None:
+            stats = 0, 0, 0
+        else:
+            stats = cache.hits, cache.misses, cache.evictions
+        print '  %-8d %12.3f %10d %10d %10d' % (
+            (cache_size, 1e6 * lookup / len(prefixes)) + stats)
+
+def bench_random_letters(words, sample_count=1000000):
+    word_index = WordIndex(words)
+    word_index.random_letter()
+    letter_counts = dict(word_index.letter_counts)
+    scan_count = sample_count // 10
+    start = time.time()
+    for _ in xrange(scan_count):
+        scan_random_letter(letter_counts)
+    scan_time = (time.time() - start) / scan_count
+    start = time.time()
+    for _ in xrange(scan_count):
+        word_index.random_letter()
+    bisect_time = (time.time() - start) / scan_count
+    start = time.time()
+    word_index.random_letters(sample_count, random.Random(0))
+    batch_time = (time.time() - start) / sample_count
+    print 'Random letters'
+    print '  linear scan  %8.3f us' % (1e6 * scan_time)
+    print '  bisect       %8.3f us' % (1e6 * bisect_time)
+    print '  batch        %8.3f us' % (1e6 * batch_time)
+
+def time_startup(load, repeat=5):
+    best = None
+    for _ in xrange(repeat):
+        gc.collect()
+        start = time.time()
+        word_index = load()
+        word_index.complete(u'NUCLEU')
+        elapsed = time.time() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    return best
+
+def bench_startup(word_list_path, words):
+    temp_dir = tempfile.mkdtemp()
+    try:
+        dict_pickle_path = os.path.join(temp_dir, 'dict-index.pickle')
+        dawg_pickle_path = os.path.join(temp_dir, 'word-index.pickle')
+        binary_path = os.path.join(temp_dir, 'word-index.bin')
+        word_index = WordIndex(words)
+        for path, obj in ((dict_pickle_path, DictWordIndex(words)),
+                          (dawg_pickle_path, word_index)):
+            with open(path, 'wb') as pickle_file:
+                pickle.dump(obj, pickle_file, pickle.HIGHEST_PROTOCOL)
+        checksum = word_list_checksum(word_list_path)
+        word_index.save(binary_path, checksum)
+
+        def load_pickle(path):
+            with open(path, 'rb') as pickle_file:
+                return pickle.load(pickle_file)
+
+        def load_binary():
+            return WordIndex.load(binary_path,
+                                  word_list_checksum(word_list_path))
+
+        print 'Startup (load and first lookup)'
+        print '  %-16s %12s %12s' % ('', 'size (kB)', 'time (ms)')
+        for name, path, load in (
+            ('parse', word_list_path,
+             lambda: WordIndex.parse(word_list_path)),
+            ('dict pickle', dict_pickle_path,
+             lambda: load_pickle(dict_pickle_path)),
+            ('dawg pickle', dawg_pickle_path,
+             lambda: load_pickle(dawg_pickle_path)),
+            ('dawg mmap', binary_path, load_binary)):
+            repeat = 1 if name == 'parse' else 5
+            print '  %-16s %12d %12.1f' % (name,
+                                           os.path.getsize(path) // 1024,
+                                           1e3 * time_startup(load, repeat))
+    finally:
+        shutil.rmtree(temp_dir)
+
+def create_physics(body_count, spring_joints, seed=0):
+    rng = random.Random(seed)
+    world = create_world()
+    actors = ActorStore(body_count)
+    for _ in xrange(body_count):
+        angle = 2. * pi * rng.random()
+        distance = config.creation_distance * sqrt(rng.random())
+        position = distance * cos(angle), distance * sin(angle)
+        radius = (config.min_radius +
+                  rng.random() * (config.max_radius - config.min_radius))
+        body = create_letter_body(world, position, 2. * pi * rng.random(),
+                                  radius, spring_joints)
+        actor = actors.add(u'A', radius, body)
+        body.userData = actor
+        if spring_joints:
+            actors.springs[actor] = create_center_spring(world, body)
+    return world, actors
+
+def bench_physics(body_counts=(50, 100, 200, 400, 800), tick_count=300):
+    print 'Physics (ticks per second)'
+    print '  %-8s %12s %12s' % ('bodies', 'forces', 'joints')
+    for body_count in body_counts:
+        rates = []
+        for spring_joints in (False, True):
+            world, actors = create_physics(body_count, spring_joints)
+            start = time.time()
+            for _ in xrange(tick_count):
+                if spring_joints:
+                    apply_destroy_forces(actors)
+                else:
+                    apply_spring_forces(actors)
+                world.Step(config.time_step, 10, 8)
+            rates.append(tick_count / (time.time() - start))
+        print '  %-8d %12.0f %12.0f' % ((body_count,) + tuple(rates))
+
+@contextmanager
+def config_override(**settings):
+    saved = dict((name, getattr(config, name)) for name in settings)
+    for name, value in settings.iteritems():
+        setattr(config, name, value)
+    try:
+        yield
+    finally:
+        for name, value in saved.iteritems():
+            setattr(config, name, value)
+
+# Picks a word that can be spelled with the letters in the game, if any.
+def find_word(game, words, rng, attempts=1000):
+    for _ in xrange(attempts):
+        word = rng.choice(words)
+        letter_counts = defaultdict(int)
+        for letter in word:
+            letter_counts[letter] += 1
+        if all(game.actors.count(letter) >= count
+               for letter, count in letter_counts.iteritems()):
+            return word
+    return None
+
+# Plays a headless session for the given game time, as fast as it will go.
+# The world is filled up front, and from then on letters are spawned at the
+# creation interval and a word is submitted every submit interval, as a
+# player would. Returns the total time spent in ticks, spawns and
+# submissions, with their counts and the actor pool hits.
+def play_session(word_index, words, duration, submit_interval=1., seed=0):
+    rng = random.Random(seed)
+    # The solver thread would compete with the timed ticks.
+    with config_override(solver=False):
+        game = Game(word_index, random.Random(seed))
+    try:
+        times = defaultdict(float)
+        counts = defaultdict(int)
+
+        def spawn():
+            start = time.time()
+            actor = game.create_letter()
+            if actor is not None:
+                times['spawn'] += time.time() - start
+                counts['spawn'] += 1
+            return actor
+
+        while spawn() is not None:
+            pass
+        next_spawn = next_submit = 0.
+        for _ in xrange(int(round(duration / config.time_step))):
+            if game.world_time >= next_spawn:
+                next_spawn += config.creation_interval
+                spawn()
+            if game.world_time >= next_submit:
+                next_submit += submit_interval
+                word = find_word(game, words, rng)
+                if word is not None:
+                    start = time.time()
+                    game.select_letters(word)
+                    game.submit_word()
+                    times['submit'] += time.time() - start
+                    counts['submit'] += 1
+            start = time.time()
+            game.tick()
+            times['tick'] += time.time() - start
+            counts['tick'] += 1
+        counts['pool_hits'] = game.actors.hits
+        return times, counts
+    finally:
+        game.close()
+
+# Every setting is varied on its own around the configured defaults.
+def bench_game(word_index, words, duration=10.,
+               letter_counts=(23, 46, 92, 184),
+               time_steps=(1. / 30., 1. / 60., 1. / 120.),
+               radii=((0.4, 0.6), (0.8, 1.2), (1.6, 2.4))):
+    default = (config.letter_count, config.time_step,
+               (config.min_radius, config.max_radius))
+    settings = [default]
+    settings.extend((c,) + default[1:] for c in letter_counts)
+    settings.extend(default[:1] + (t,) + default[2:] for t in time_steps)
+    settings.extend(default[:2] + (r,) for r in radii)
+    words = [word for word in words if len(word) <= 6]
+    print 'Game loop (%.0f s of game time per setting)' % duration
+    print '  %-8s %10s %10s %10s %8s %11s %11s %6s %6s' % (
+        'letters', 'step (ms)', 'radius', 'ticks/s', 'x real',
+        'spawn (us)', 'submit (us)', 'words', 'pool')
+    for setting in sorted(set(settings), key=settings.index):
+        letter_count, time_step, (min_radius, max_radius) = setting
+        with config_override(letter_count=letter_count, time_step=time_step,
+                             min_radius=min_radius, max_radius=max_radius):
+            times, counts = play_session(word_index, words, duration)
+        tick_rate = counts['tick'] / times['tick']
+        print '  %-8d %10.2f %10s %10.0f %8.1f %11.1f %11.1f %6d %5.0f%%' % (
+            letter_count, 1e3 * time_step,
+            '%.1f-%.1f' % (min_radius, max_radius), tick_rate,
+            tick_rate * time_step,
+            1e6 * times['spawn'] / max(counts['spawn'], 1),
+            1e6 * times['submit'] / max(counts['submit'], 1),
+            counts['submit'],
+            100. * counts['pool_hits'] / max(counts['spawn'], 1))
+
+# Follows a board of letters that come and go at random, and compares the
+# incremental updates of the solver with searching from scratch after every
+# change.
+def bench_solver(word_index, update_count=1000, letter_count=46,
+                 word_count=10, seed=0):
+    rng = random.Random(seed)
+    solver = Solver(word_index, word_count, budget=1.)
+    board = []
+    incremental_times = []
+    full_times = []
+    for _ in xrange(update_count):
+        if len(board) >= letter_count or (board and rng.random() < 0.3):
+            solver.remove(board.pop(rng.randrange(len(board))))
+        else:
+            board.append(word_index.random_letter(rng))
+            solver.add(board[-1])
+        start = time.time()
+        solver.update()
+        incremental_times.append(time.time() - start)
+        counts = [0] * len(word_index.alphabet)
+        for letter in board:
+            counts[word_index.letter_indices[letter]] += 1
+        start = time.time()
+        word_index.find_longest_words(counts, word_count)
+        full_times.append(time.time() - start)
+    print 'Solver (ms per change, %d changes, up to %d letters)' % (
+        update_count, letter_count)
+    print '  %-12s %8s %8s %8s %8s' % ('', 'mean', 'p50', 'p95', 'max')
+    for name, times in (('incremental', incremental_times),
+                        ('full', full_times)):
+        times.sort()
+        print '  %-12s %8.3f %8.3f %8.3f %8.3f' % (
+            name, 1e3 * sum(times) / len(times),
+            1e3 * percentile(times, 0.5), 1e3 * percentile(times, 0.95),
+            1e3 * times[-1])
+    print '  %d of %d changes searched' % (solver.search_count, update_count)
+
+def create_sprite_frames(sprite_count, frame_count, seed=0):
+    rng = random.Random(seed)
+    colors = (config.color, config.prefix_color, config.word_color)
+    return [[(rng.uniform(0., 1000.), rng.uniform(0., 1000.),
+              rng.uniform(0., 360.), rng.choice(colors))
+             for _ in xrange(sprite_count)]
+            for _ in xrange(frame_count)]
+
+def time_sprite_frames(update, frames):
+    start = time.time()
+    for frame in frames:
+        update(frame)
+    return (time.time() - start) / len(frames)
+
+def bench_sprites(sprite_counts=(50, 500, 5000), frame_count=20):
+    # Imported here, so that the headless benchmarks run without a display.
+    import pyglet
+    import sprite
+    window = pyglet.window.Window(visible=False)
+    try:
+        image = pyglet.image.SolidColorImagePattern((255, 255, 255, 255))
+        texture = image.create_image(16, 16).get_texture()
+        print 'Sprites (ms per frame)'
+        print '  %-8s %12s %12s %12s' % ('sprites', 'immediate', 'deferred',
+                                         'array')
+        for sprite_count in sprite_counts:
+            frames = create_sprite_frames(sprite_count, frame_count)
+            times = []
+
+            batch = pyglet.graphics.Batch()
+            sprites = [sprite.Sprite(texture, batch=batch, subpixel=True)
+                       for _ in xrange(sprite_count)]
+            def update_immediate(frame):
+                for s, (x, y, rotation, color) in izip(sprites, frame):
+                    s.color = color
+                    s.position = x, y
+                    s.rotation = rotation
+            times.append(time_sprite_frames(update_immediate, frames))
+
+            batch = sprite.Batch()
+            sprites = [sprite.Sprite(texture, batch=batch, subpixel=True)
+                       for _ in xrange(sprite_count)]
+            def update_deferred(frame):
+                for s, (x, y, rotation, color) in izip(sprites, frame):
+                    s.color = color
+                    s.set_transform(x, y, rotation, s.scale)
+                batch.flush()
+            times.append(time_sprite_frames(update_deferred, frames))
+
+            if sprite.numpy is not None:
+                sprite_array = sprite.SpriteArray(texture,
+                                                  batch=sprite.Batch(),
+                                                  subpixel=True,
+                                                  capacity=sprite_count)
+                for _ in xrange(sprite_count):
+                    sprite_array.add(texture)
+                array_frames = [sprite.numpy.array([(x, y, rotation) + color
+                                for x, y, rotation, color in frame])
+                                for frame in frames]
+                def update_array(frame):
+                    sprite_array.positions[:] = frame[:, 0:2]
+                    sprite_array.rotations[:] = frame[:, 2]
+                    sprite_array.colors[:, :3] = frame[:, 3:6]
+                    sprite_array.colors_dirty = True
+                    sprite_array.update()
+                times.append(time_sprite_frames(update_array, array_frames))
+            else:
+                times.append(float('nan'))
+            print '  %-8d %12.3f %12.3f %12.3f' % (
+                (sprite_count,) + tuple(1e3 * t for t in times))
+    finally:
+        window.close()
+
+# Adds sprites to a batch under one parent group and migrates them to
+# another, with a new group per sprite as pyglet does and with interned
+# groups.
+def bench_sprite_groups(sprite_count=5000):
+    import pyglet
+    import sprite
+    window = pyglet.window.Window(visible=False)
+    get_sprite_group = sprite.get_sprite_group
+    try:
+        image = pyglet.image.SolidColorImagePattern((255, 255, 255, 255))
+        texture = image.create_image(16, 16).get_texture()
+        parents = [pyglet.graphics.OrderedGroup(i) for i in xrange(2)]
+        print 'Sprite groups (us per sprite, %d sprites)' % sprite_count
+        print '  %-10s %10s %10s %10s' % ('', 'add', 'migrate', 'groups')
+        for name, get_group in (('new', sprite.SpriteGroup),
+                                ('interned', get_sprite_group)):
+            sprite.get_sprite_group = get_group
+            batch = sprite.Batch()
+            start = time.time()
+            sprites = [sprite.Sprite(texture, batch=batch, group=parents[0])
+                       for _ in xrange(sprite_count)]
+            add_time = time.time() - start
+            start = time.time()
+            for s in sprites:
+                s.group = parents[1]
+            migrate_time = time.time() - start
+            group_count = len(set(id(s._group) for s in sprites))
+            print '  %-10s %10.2f %10.2f %10d' % (
+                name, 1e6 * add_time / sprite_count,
+                1e6 * migrate_time / sprite_count, group_count)
+    finally:
+        sprite.get_sprite_group = get_sprite_group
+        window.close()
+
+# Captures frames of a window that changes color every frame, with the
+# asynchronous and the synchronous readback. Runs on the Mesa software
+# renderer with LIBGL_ALWAYS_SOFTWARE=1.
+def bench_capture(frame_count=300, width=640, height=480, interval=1):
+    from capture import FrameCapture
+    import pyglet
+    from pyglet.gl import glClear, glClearColor, GL_COLOR_BUFFER_BIT
+    window = pyglet.window.Window(width, height, visible=False)
+    temp_dir = tempfile.mkdtemp()
+    try:
+        print 'Capture (%dx%d, every %d of %d frames)' % (width, height,
+                                                        interval, frame_count)
+        print '  %-8s %10s %10s %10s %10s' % ('', 'ms/frame', 'captured',
+                                              'dropped', 'written')
+        for name, asynchronous in (('pbo', True), ('sync', False)):
+            directory = os.path.join(temp_dir, name)
+            frame_capture = FrameCapture(directory, width, height, interval,
+                                         asynchronous=asynchronous)
+            start = time.time()
+            for i in xrange(frame_count):
+                glClearColor(float(i % 256) / 255., 0.5, 0.5, 1.)
+                glClear(GL_COLOR_BUFFER_BIT)
+                frame_capture.capture()
+                window.flip()
+            capture_time = (time.time() - start) / frame_count
+            frame_capture.close()
+            print '  %-8s %10.2f %10d %10d %10d' % (
+                name, 1e3 * capture_time, frame_capture.captured,
+                frame_capture.dropped, len(os.listdir(directory)))
+    finally:
+        shutil.rmtree(temp_dir)
+        window.close()
+
+def bench_hud(frame_count=600, font_size=20):
+    from main import format_time
+    import hud
+    import pyglet
+    import sprite
+    window = pyglet.window.Window(visible=False)
+    try:
+        # Seconds left and score per frame: the clock ticks once a second
+        # and the score changes now and then.
+        frames = [(60 - i // 60, 10 * (i // 150)) for i in xrange(frame_count)]
+        print 'HUD (us per frame, %d frames)' % frame_count
+        batch = pyglet.graphics.Batch()
+        labels = [pyglet.text.Label(font_size=font_size, x=x, y=100,
+                                    anchor_x=anchor_x, batch=batch)
+                  for x, anchor_x in ((0, 'left'), (400, 'right'))]
+        def update_labels(frame):
+            seconds, score = frame
+            labels[0].text = u'Score: %d' % score
+            labels[1].text = u'Time: %s' % format_time(seconds)
+        label_time = time_sprite_frames(update_labels, frames)
+        batch = sprite.Batch()
+        fields = [hud.HudField(u'Score: ', unicode, 0, 100, font_size,
+                               batch=batch),
+                  hud.HudField(u'Time: ', format_time, 400, 100, font_size,
+                               anchor_x='right', batch=batch)]
+        def update_fields(frame):
+            seconds, score = frame
+            fields[0].set_value(score)
+            fields[1].set_value(seconds)
+            batch.flush()
+        field_time = time_sprite_frames(update_fields, frames)
+        print '  labels  %10.1f' % (1e6 * label_time)
+        print '  fields  %10.1f' % (1e6 * field_time)
+    finally:
+        window.close()
+
+def main(args=sys.argv[1:]):
+    parser = OptionParser(usage='%prog [options] [benchmark ...]')
+    parser.add_option('-w', '--word-list', help='word list to index')
+    options, names = parser.parse_args(args)
+    word_list_path = options.word_list
+    if word_list_path is None:
+        word_list_path = os.path.join(require_data_dir(),
+                                      config.word_list_file)
+    words = read_words(word_list_path)
+    benchmarks = OrderedDict([
+        ('words', lambda: bench_word_index(words)),
+        ('cache', lambda: bench_completion_cache(words)),
+        ('startup', lambda: bench_startup(word_list_path, words)),
+        ('letters', lambda: bench_random_letters(words)),
+        ('physics', bench_physics),
+        ('game', lambda: bench_game(WordIndex(words), words)),
+        ('solver', lambda: bench_solver(WordIndex(words))),
+        ('sprites', bench_sprites),
+        ('groups', bench_sprite_groups),
+        ('capture', bench_capture),
+        ('hud', bench_hud)])
+    for name in names:
+        if name not in benchmarks:
+            parser.error('unknown benchmark %r, expected one of: %s' %
+                         (name, ', '.join(benchmarks)))
+    for name in names or benchmarks:
+        benchmarks[name]()
+
+if __name__ == '__main__':
+    main()
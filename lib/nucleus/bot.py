@@ -0,0 +1,219 @@
+from __future__ import with_statement
+
+import config
+from game import Game, create_word_index, require_data_dir
+from profiler import percentile
+from replay import applied_settings, apply_event
+from ast import literal_eval
+from collections import *
+from optparse import OptionParser
+import random
+import sys
+import time
+
+# A bot plays the game with the same text and key events as a player, typed
+# at a given number of keys per second of game time, or as fast as the
+# strategy can decide. Strategies look at the game and return the next
+# event as a pair of kind and value, in the vocabulary of recordings: text
+# with a letter, or a key by name. The game screen sends the events through
+# its own handlers. Headless games send them the way replays do, and run as
+# fast as they will go.
+
+class Bot(object):
+    def __init__(self, strategy, typing_speed=None, max_keys=64):
+        self.strategy = strategy
+        self.typing_speed = typing_speed
+        self.max_keys = max_keys
+        self._keys = 0.
+
+    # Sends the events that were typed in the last dt seconds.
+    def update(self, game, dt, send):
+        if self.typing_speed is None:
+            key_count = self.max_keys
+        else:
+            self._keys = min(self._keys + dt * self.typing_speed,
+                             self.max_keys)
+            key_count = int(self._keys)
+        for _ in xrange(key_count):
+            event = self.strategy.next_event(game)
+            if event is None:
+                # Idle time does not save up keys.
+                self._keys = min(self._keys, 1.)
+                break
+            if self.typing_speed is not None:
+                self._keys -= 1.
+            send(*event)
+
+# Follows the nearest letter that continues the selection, and submits as
+# soon as the selection is a word. Dead ends are backed out of, and the
+# selection is given up after the patience runs out.
+class GreedyStrategy(object):
+    def __init__(self, patience=32):
+        self.patience = patience
+        self._dead_ends = set()
+        self._key_count = 0
+
+    def next_event(self, game):
+        if game.cursor.is_word() or self._key_count >= self.patience:
+            self._dead_ends.clear()
+            self._key_count = 0
+            return 'key', 'ENTER'
+        actors = game.actors
+        prefix = u''.join(actors.get_letter(a) for a in game.selection)
+        position = game.get_last_position()
+        best_letter = None
+        best_distance = None
+        for letter in game.cursor.next_letters():
+            if prefix + letter in self._dead_ends:
+                continue
+            actor = game.find_actor(letter)
+            if actor is not None:
+                distance = (actors.bodies[actor].position -
+                            position).LengthSquared()
+                if best_distance is None or distance < best_distance:
+                    best_letter = letter
+                    best_distance = distance
+        if best_letter is not None:
+            self._key_count += 1
+            return 'text', best_letter.lower()
+        if not prefix:
+            return None
+        self._dead_ends.add(prefix)
+        self._key_count += 1
+        return 'key', 'BACKSPACE'
+
+# Types the longest word that can be spelled with the letters on the board,
+# or one of the longest few, found within a time budget. A word is given up
+# if one of its letters is missing or gone before it has been typed.
+class DictionaryStrategy(object):
+    def __init__(self, word_count=1, budget=0.01, rng=random):
+        self.word_count = word_count
+        self.budget = budget
+        self.rng = rng
+        self._word = None
+        self._typed = 0
+
+    def next_event(self, game):
+        if self._word is not None and len(game.selection) != self._typed:
+            self._word = None
+            return 'key', 'ENTER'
+        if self._word is None:
+            word_index = game.word_index
+            letter_counts = [game.actors.count(l)
+                             for l in word_index.alphabet]
+            words, _ = word_index.find_longest_words(
+                letter_counts, self.word_count,
+                deadline=(time.time() + self.budget))
+            if not words:
+                return None
+            self._word = self.rng.choice(words)
+            self._typed = 0
+        if self._typed < len(self._word):
+            self._typed += 1
+            return 'text', self._word[self._typed - 1].lower()
+        self._word = None
+        return 'key', 'ENTER'
+
+# Creates a strategy from the random number generator of the game's bot.
+strategies = dict(greedy=lambda rng: GreedyStrategy(),
+                  dictionary=lambda rng: DictionaryStrategy(rng=rng))
+
+def create_bot(strategy_name, typing_speed=None, rng=random):
+    return Bot(strategies[strategy_name](rng), typing_speed)
+
+class GameStats(object):
+    def __init__(self, seed):
+        self.seed = seed
+        self.score = 0
+        self.level = 1
+        self.letter_count = 0
+        self.word_count = 0
+        self.multipliers = Counter()
+        self.tick_times = []
+        self.bot_times = []
+
+# Plays a whole game headless, spawning letters at the creation interval as
+# the game screen does. Returns the stats of the game. The tick times are of
+# the game alone, and the time that the bot takes to decide is kept apart.
+def play_game(word_index, bot, seed=0, timer=time.time):
+    game = Game(word_index, random.Random(seed))
+    stats = GameStats(seed)
+
+    def send(kind, value):
+        letter_count = len(game.selection)
+        score = game.score
+        apply_event(game, kind, value)
+        if game.score > score:
+            stats.word_count += 1
+            stats.multipliers[(game.score - score) // letter_count] += 1
+
+    next_spawn = 0.
+    while not game.over:
+        if game.world_time >= next_spawn:
+            next_spawn += config.creation_interval
+            game.create_letter()
+        start = timer()
+        bot.update(game, config.time_step, send)
+        stats.bot_times.append(timer() - start)
+        start = timer()
+        game.tick()
+        stats.tick_times.append(timer() - start)
+    game.close()
+    stats.score = game.score
+    stats.level = game.level
+    stats.letter_count = game.letter_count
+    return stats
+
+def print_header():
+    print '%-12s %7s %5s %7s %5s %8s %8s %8s %8s  %s' % (
+        'seed', 'score', 'level', 'letters', 'words', 'mean ms', 'p99 ms',
+        'max ms', 'bot ms', 'multipliers')
+
+def print_stats(stats):
+    tick_times = sorted(stats.tick_times)
+    multipliers = ' '.join('%dx%d' % (m, c)
+                           for m, c in sorted(stats.multipliers.items()))
+    print '%-12d %7d %5d %7d %5d %8.3f %8.3f %8.3f %8.3f  %s' % (
+        stats.seed, stats.score, stats.level, stats.letter_count,
+        stats.word_count,
+        1e3 * sum(tick_times) / max(len(tick_times), 1),
+        1e3 * percentile(tick_times, 0.99), 1e3 * percentile(tick_times, 1.),
+        1e3 * sum(stats.bot_times) / max(len(stats.bot_times), 1),
+        multipliers)
+
+def main(args=sys.argv[1:]):
+    parser = OptionParser(usage='%prog [options]')
+    parser.add_option('-s', '--strategy', default='dictionary',
+                      choices=sorted(strategies),
+                      help='one of: %s' % ', '.join(sorted(strategies)))
+    parser.add_option('-n', '--games', type='int', default=10,
+                      help='play N games')
+    parser.add_option('-t', '--typing-speed', type='float',
+                      help='type at most N keys per second of game time')
+    parser.add_option('--seed', type='int', default=0,
+                      help='seed of the first game')
+    parser.add_option('--set', action='append', default=[],
+                      metavar='NAME=VALUE', help='override a setting')
+    options, args = parser.parse_args(args)
+    if args:
+        parser.error('unexpected arguments')
+    settings = {}
+    for setting in options.set:
+        name, _, value = setting.partition('=')
+        if not hasattr(config, name):
+            parser.error('unknown setting %r' % name)
+        try:
+            settings[name] = literal_eval(value)
+        except (SyntaxError, ValueError):
+            parser.error('bad value for %s: %r' % (name, value))
+    data_dir = require_data_dir()
+    with applied_settings(settings):
+        word_index = create_word_index(data_dir)
+        print_header()
+        for seed in xrange(options.seed, options.seed + options.games):
+            bot = create_bot(options.strategy, options.typing_speed,
+                             random.Random(seed))
+            print_stats(play_game(word_index, bot, seed))
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,152 @@
+from __future__ import with_statement
+
+import ctypes
+import multiprocessing
+import os
+import Queue
+import struct
+import zlib
+from pyglet.gl import *
+from pyglet.gl import gl_info
+
+# Captures every Nth frame of the window into a numbered sequence of PNG
+# files. Each capture starts reading the color buffer into one of two pixel
+# buffer objects, which the driver fills without stalling the frame, and
+# copies out the other one, which was filled at the previous capture.
+# Without pixel buffer objects, the pixels are read synchronously instead.
+# The frames are compressed and written by a worker process. They are
+# handed over through a bounded queue, so that a slow disk cannot use up the
+# memory: frames that do not fit are dropped and counted.
+
+class FrameCapture(object):
+    def __init__(self, directory, width, height, interval=1, queue_size=8,
+                 asynchronous=None):
+        if asynchronous is None:
+            asynchronous = (gl_info.have_version(2, 1) or
+                            gl_info.have_extension(
+                                'GL_ARB_pixel_buffer_object'))
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+        self.directory = directory
+        self.width = width
+        self.height = height
+        self.interval = interval
+        self.asynchronous = asynchronous
+        self.frame_count = 0
+        self.captured = 0
+        self.dropped = 0
+        self._size = 3 * width * height
+        self._written = multiprocessing.Value('i', 0)
+        self._queue = multiprocessing.Queue(queue_size)
+        self._process = multiprocessing.Process(
+            target=_write_frames,
+            args=(self._queue, directory, width, height, self._written))
+        self._process.daemon = True
+        self._process.start()
+        self._buffers = None
+        self._pending = None
+        if asynchronous:
+            self._buffers = (GLuint * 2)()
+            glGenBuffers(2, self._buffers)
+            for pixel_buffer in self._buffers:
+                glBindBuffer(GL_PIXEL_PACK_BUFFER_ARB, pixel_buffer)
+                glBufferData(GL_PIXEL_PACK_BUFFER_ARB, self._size, None,
+                             GL_STREAM_READ)
+            glBindBuffer(GL_PIXEL_PACK_BUFFER_ARB, 0)
+
+    # Frames that have been written to disk by the worker.
+    @property
+    def written(self):
+        return self._written.value
+
+    # Call once per frame, after drawing and before the buffers are flipped.
+    def capture(self):
+        frame_number = self.frame_count
+        self.frame_count += 1
+        if frame_number % self.interval:
+            return
+        glPushClientAttrib(GL_CLIENT_PIXEL_STORE_BIT)
+        glPixelStorei(GL_PACK_ALIGNMENT, 1)
+        if self.asynchronous:
+            self._read_asynchronously(frame_number)
+        else:
+            data = ctypes.create_string_buffer(self._size)
+            glReadPixels(0, 0, self.width, self.height, GL_RGB,
+                         GL_UNSIGNED_BYTE, data)
+            self._put(frame_number, data.raw)
+        glPopClientAttrib()
+
+    def _read_asynchronously(self, frame_number):
+        index = 0
+        if self._pending is not None:
+            index = 1 - self._pending[1]
+        glBindBuffer(GL_PIXEL_PACK_BUFFER_ARB, self._buffers[index])
+        glReadPixels(0, 0, self.width, self.height, GL_RGB, GL_UNSIGNED_BYTE,
+                     0)
+        self._flush_pending()
+        self._pending = frame_number, index
+
+    # Copies out the frame that was read into the other pixel buffer at the
+    # previous capture.
+    def _flush_pending(self):
+        if self._pending is not None:
+            frame_number, index = self._pending
+            self._pending = None
+            glBindBuffer(GL_PIXEL_PACK_BUFFER_ARB, self._buffers[index])
+            pointer = glMapBuffer(GL_PIXEL_PACK_BUFFER_ARB, GL_READ_ONLY)
+            if pointer:
+                self._put(frame_number, ctypes.string_at(pointer, self._size))
+                glUnmapBuffer(GL_PIXEL_PACK_BUFFER_ARB)
+            else:
+                self.dropped += 1
+        glBindBuffer(GL_PIXEL_PACK_BUFFER_ARB, 0)
+
+    def _put(self, frame_number, data):
+        try:
+            self._queue.put_nowait((frame_number, data))
+            self.captured += 1
+        except Queue.Full:
+            self.dropped += 1
+
+    # Hands over the last frame and waits for the worker to write everything
+    # in the queue. Needs the GL context that the capture was created in.
+    def close(self):
+        if self._buffers is not None:
+            self._flush_pending()
+            glDeleteBuffers(2, self._buffers)
+            self._buffers = None
+        self._queue.put(None)
+        self._process.join()
+
+def _write_frames(queue, directory, width, height, written):
+    while True:
+        frame = queue.get()
+        if frame is None:
+            break
+        frame_number, data = frame
+        path = os.path.join(directory, 'frame-%06d.png' % frame_number)
+        with open(path, 'wb') as frame_file:
+            write_png(frame_file, width, height, data)
+        with written.get_lock():
+            written.value += 1
+
+# Writes bottom-up RGB rows, as read from OpenGL, as a PNG image. The lowest
+# compression level keeps the worker ahead of the frame rate.
+def write_png(png_file, width, height, data):
+    pitch = 3 * width
+    rows = []
+    for y in xrange(height - 1, -1, -1):
+        rows.append('\0')
+        rows.append(data[y * pitch:(y + 1) * pitch])
+    png_file.write('\x89PNG\r\n\x1a\n')
+    _write_png_chunk(png_file, 'IHDR',
+                     struct.pack('>IIBBBBB', width, height, 8, 2, 0, 0, 0))
+    _write_png_chunk(png_file, 'IDAT', zlib.compress(''.join(rows), 1))
+    _write_png_chunk(png_file, 'IEND', '')
+
+def _write_png_chunk(png_file, chunk_type, data):
+    png_file.write(struct.pack('>I', len(data)))
+    png_file.write(chunk_type)
+    png_file.write(data)
+    png_file.write(struct.pack('>I',
+                               zlib.crc32(chunk_type + data) & 0xffffffff))
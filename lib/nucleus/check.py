@@ -0,0 +1,91 @@
+from __future__ import with_statement
+
+import config
+from wordindex import WordIndex
+import codecs
+from collections import *
+from math import *
+from optparse import OptionParser
+import random
+import sys
+
+# Checks of the word index that run without Box2D, pyglet or the data
+# directory, and exit with a nonzero status on failure. The letters are
+# sampled from a fixed seed, so that a run that passes once always passes.
+# Without a word list, the words below are indexed.
+
+sample_words = u'''
+    ATOM BOSON CHARGE DECAY ELECTRON ENERGY FIELD FISSION FUSION GLUON
+    HADRON ION ISOTOPE KAON LEPTON MASS MESON MUON NEUTRINO NEUTRON NUCLEUS
+    ORBIT PHOTON PION PROTON QUARK QUANTUM SPIN WAVE XENON YIELD ZINC
+'''.split()
+
+class CheckError(Exception):
+    pass
+
+# Pearson's chi-squared statistic of the observed letters against the
+# letter counts of the word list, with the critical value at p = 0.001 from
+# the Wilson-Hilferty approximation.
+def letter_chi_squared(letter_counts, letters):
+    total_count = float(sum(letter_counts.values()))
+    observed = defaultdict(int)
+    for letter in letters:
+        observed[letter] += 1
+    chi_squared = 0.
+    for letter, count in letter_counts.iteritems():
+        expected = len(letters) * count / total_count
+        chi_squared += (observed[letter] - expected) ** 2 / expected
+    df = len(letter_counts) - 1
+    critical = df * (1. - 2. / (9. * df) + 3.09 * sqrt(2. / (9. * df))) ** 3
+    return chi_squared, df, critical
+
+# Both samplers must follow the letter counts of the word list, and give
+# the same letters for the same seed.
+def check_random_letters(word_index, sample_count=100000, seed=0):
+    letter_counts = dict((l, c) for l, c in word_index.letter_counts.items()
+                         if c)
+    rng = random.Random(seed)
+    single_letters = [word_index.random_letter(rng)
+                      for _ in xrange(sample_count)]
+    batch_letters = word_index.random_letters(sample_count,
+                                              random.Random(seed))
+    if batch_letters != word_index.random_letters(sample_count,
+                                                  random.Random(seed)):
+        raise CheckError('random_letters differs between runs with the '
+                         'same seed')
+    for name, letters in (('random_letter', single_letters),
+                          ('random_letters', batch_letters)):
+        unknown_letters = set(letters) - set(letter_counts)
+        if unknown_letters:
+            raise CheckError('%s returned letters that are not in any word: '
+                             '%s' % (name, ''.join(sorted(unknown_letters))))
+        chi_squared, df, critical = letter_chi_squared(letter_counts,
+                                                       letters)
+        if chi_squared >= critical:
+            raise CheckError('%s does not follow the letter counts: '
+                             'chi-squared %.1f, df %d, critical %.1f at '
+                             'p = 0.001' % (name, chi_squared, df, critical))
+
+def main(args=sys.argv[1:]):
+    parser = OptionParser(usage='%prog [options]')
+    parser.add_option('-w', '--word-list', help='word list to index')
+    options, args = parser.parse_args(args)
+    if args:
+        parser.error('unexpected arguments')
+    if options.word_list is None:
+        words = sample_words
+    else:
+        with codecs.open(options.word_list, 'r',
+                         config.word_list_encoding) as word_list_file:
+            words = [line.strip().upper() for line in word_list_file]
+        alphabet = set(config.alphabet)
+        words = [w for w in words if w and not set(w) - alphabet]
+    try:
+        check_random_letters(WordIndex(words, cache_size=0))
+    except CheckError, error:
+        sys.stderr.write('%s\n' % error)
+        sys.exit(1)
+    print 'ok'
+
+if __name__ == '__main__':
+    main()
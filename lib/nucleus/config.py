@@ -7,29 +7,57 @@ debug_color = 0, 255, 0
 # Physics simulation.
 world_radius = 100.
 time_step = 1. / 60.
+max_substeps = 5
+# What to do with the time that max_substeps leaves over: 'drop' or 'slow'.
+catch_up = 'drop'
 friction = 1.
 restitution = 0.
 density = 1.
 spring_constant = 10.
 damping = 5.
 destroy_force = 500.
+# Springs and damping of live letters in Box2D instead of forces from
+# Python, which then only pushes out the destroyed letters.
+spring_joints = True
 
 # Presentation.
 rotate_letters = True
 scale_letters = True
 subpixel = True
+interpolate = True
 circle_vertex_count = 64
+sprite_arrays = True
 fullscreen = True
 view_height = 25.
 
+# Profiling.
+profile = False
+profile_overlay = False
+profile_size = 1024
+
+# Capture.
+capture = False
+capture_interval = 2
+capture_queue_size = 16
+
+# Bot player, one of the strategies in the bot module, or None.
+bot = None
+bot_typing_speed = 8.
+
 # Gameplay.
 letter_count = 46
 hint = False
+hint_threshold = 0.5
 time_limit = 30.
 creation_distance = 30.
 creation_interval = 0.2
 min_radius = 0.8
 max_radius = 1.2
+letter_grid_cell_size = 4.
+actor_pool_size = 64
+solver = False
+solver_word_count = 10
+solver_budget = 0.05
 levels = [10, 30, 60, 100, 150, 210, 280, 360, 450, 550, 660, 780, 910, 1050]
 extra_time = 30.
 
@@ -38,7 +66,11 @@ word_list_file = 'enable.txt'
 word_list_encoding = 'ASCII'
 alphabet = u'ABCDEFGHIJKLMNOPQRSTUVWXYZ'
 save_word_index = True
+save_glyph_atlas = True
+# Prefixes cached by WordIndex.complete, which the game itself does not use.
+completion_cache_size = 0
 save_highscores = True
+record_sessions = False
 
 # Font.
 font_name = None
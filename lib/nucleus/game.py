@@ -0,0 +1,553 @@
+from actors import ActorStore, LIVE
+import config
+from profiler import null_profiler
+from solver import Solver
+import spatial
+from wordindex import WordIndex, word_list_checksum
+from Box2D import *
+from collections import *
+from math import *
+import os
+import random
+import sys
+import threading
+
+def get_data_dir():
+    data_dir = os.environ.get('NUCLEUS_DATA_DIR')
+    if data_dir is not None:
+        return data_dir
+    data_dir = os.path.dirname(os.path.abspath(__file__))
+    while True:
+        new_data_dir = os.path.join(data_dir, 'data')
+        if os.path.exists(new_data_dir):
+            return new_data_dir
+        new_data_dir = os.path.dirname(data_dir)
+        if new_data_dir == data_dir:
+            return None
+        data_dir = new_data_dir
+
+# Exits with an error message if the data directory cannot be found.
+def require_data_dir():
+    data_dir = get_data_dir()
+    if data_dir is None:
+        sys.stderr.write('Cannot find Nucleus data. Please set environment '
+                         'variable NUCLEUS_DATA_DIR.\n')
+        sys.exit(1)
+    return data_dir
+
+# The progress callback is called with a message when a phase starts, and
+# with the fraction done while the word list is parsed.
+def create_word_index(data_dir, progress=None):
+    if progress is None:
+        progress = _print_progress
+    word_list_path = os.path.join(data_dir, config.word_list_file)
+    if config.save_word_index:
+        word_index_path = os.path.join(data_dir, 'word-index.bin')
+        checksum = word_list_checksum(word_list_path)
+        if os.path.exists(word_index_path):
+            progress('Loading word index...')
+            try:
+                return WordIndex.load(word_index_path, checksum)
+            except ValueError:
+                progress('Word index is stale.')
+    progress('Indexing word list...')
+    word_index = WordIndex.parse(
+        word_list_path, config.word_list_encoding,
+        progress=lambda fraction: progress(None, fraction))
+    if config.save_word_index:
+        progress('Saving word index...')
+        word_index.save(word_index_path, checksum)
+    return word_index
+
+def _print_progress(message, fraction=None):
+    if message is not None:
+        print message
+
+# Creates the word index on a background thread. Until done is set, message
+# and fraction tell how far it has come. Exceptions are kept and raised
+# again by get_word_index.
+class WordIndexLoader(object):
+    def __init__(self, data_dir):
+        self.data_dir = data_dir
+        self.message = None
+        self.fraction = 0.
+        self.done = False
+        self._word_index = None
+        self._exc_info = None
+        self._thread = threading.Thread(target=self._run)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def _run(self):
+        try:
+            self._word_index = create_word_index(self.data_dir,
+                                                 self._progress)
+        except Exception:
+            self._exc_info = sys.exc_info()
+        self.done = True
+
+    def _progress(self, message, fraction=None):
+        if message is not None:
+            self.message = message
+            self.fraction = 0.
+        if fraction is not None:
+            self.fraction = fraction
+
+    def get_word_index(self):
+        if self._exc_info is not None:
+            raise self._exc_info[0], self._exc_info[1], self._exc_info[2]
+        return self._word_index
+
+# A game session without a window: the world, the letters, the selection and
+# the score. The game screen drives it from the pyglet clock and keyboard,
+# and draws it, but it runs just as well headless. Sprites are attached to
+# the actor store by whoever draws them. The letters version is bumped whenever
+# the selection or the letters change, so that views know when to recolor.
+# The solver, if enabled, follows the letters on a thread of its own until
+# the game is closed.
+class Game(object):
+    def __init__(self, word_index, rng=random, profiler=null_profiler):
+        self.word_index = word_index
+        self.rng = rng
+        self.profiler = profiler
+        self.closing = False
+        self.actors = ActorStore(config.actor_pool_size)
+        self.selection = OrderedSet()
+        self.cursor = word_index.cursor()
+        self.hint_engine = HintEngine(config.hint_threshold)
+        self.letter_grid = spatial.LetterGrid(config.letter_grid_cell_size)
+        self.letters_version = 0
+        self.score = 0
+        if config.solver:
+            self.solver = Solver(word_index, config.solver_word_count,
+                                 config.solver_budget)
+            self.solver.start()
+        else:
+            self.solver = None
+
+        self.screen_time = 0.
+        self.world_time = 0.
+        self.tick_count = 0
+
+        self.level = 1
+        self.time_limit = config.time_limit
+
+        self.letter_count = 0
+
+        self.world = create_world()
+        self.boundary_listener = MyBoundaryListener()
+        self.world.SetBoundaryListener(self.boundary_listener)
+
+    @property
+    def over(self):
+        return self.closing and not self.actors
+
+    def close(self):
+        if self.solver is not None:
+            self.solver.stop()
+
+    def get_seconds_left(self):
+        return max(int(self.time_limit - self.world_time), 0)
+
+    def get_goal(self):
+        if self.level <= len(config.levels):
+            return config.levels[self.level - 1]
+        else:
+            return None
+
+    def select_letters(self, text):
+        for letter in text.upper():
+            actor = self.find_actor(letter)
+            if actor is not None:
+                self.selection.add(actor)
+                self.cursor.push(letter)
+                self._invalidate_letters()
+
+    def deselect_letter(self):
+        if self.selection:
+            self.selection.pop()
+            self.cursor.pop()
+            self._invalidate_letters()
+
+    # Returns the submitted word, or None if the selection was not a word and
+    # has been cleared instead.
+    def submit_word(self):
+        if not self.cursor.is_word():
+            self.selection.clear()
+            self.cursor.clear()
+            self._invalidate_letters()
+            return None
+        actors = self.actors
+        bodies = actors.bodies
+        radii = actors.radii
+        selection = list(self.selection)
+        word = u''.join(actors.get_letter(a) for a in selection)
+        multiplier = 1
+        score = len(selection)
+        self.letter_count += len(selection)
+        for i, actor in enumerate(selection):
+            for other in selection[i + 1:]:
+                if ((bodies[actor].GetWorldCenter() -
+                     bodies[other].GetWorldCenter()).LengthSquared()
+                     < (radii[actor] + radii[other] + 0.5) ** 2):
+                     multiplier += 1
+        for actor in reversed(selection):
+            self._clear_letter(actor)
+        self.score += multiplier * score
+        return word
+
+    def update_hints(self):
+        return self.hint_engine.update(self.cursor.next_letters(),
+                                       self.find_actor,
+                                       self.get_last_position(),
+                                       self.actors.bodies)
+
+    # Returns the unselected actor with the letter that is nearest to the
+    # last selected one, or None.
+    def find_actor(self, letter):
+        if self.letter_grid.is_stale(letter):
+            self._rebuild_letter_bucket(letter)
+        x, y = self.get_last_position().tuple()
+        return self.letter_grid.nearest(letter, x, y, self.selection)
+
+    # The grid goes stale whenever the world steps or letters come and go.
+    # Only the bucket of the queried letter is rebuilt, from the live actors
+    # with that letter.
+    def _rebuild_letter_bucket(self, letter):
+        bodies = self.actors.bodies
+        self.letter_grid.rebuild(
+            letter, [bodies[actor].position.tuple() + (actor,)
+                     for actor in self.actors.letter_ids.get(letter, ())])
+
+    def get_last_position(self):
+        if self.selection:
+            return self.actors.bodies[self.selection.last()].position
+        else:
+            return b2Vec2(0., 0.)
+
+    # Returns the new actor, or None if there is no room for another letter.
+    def create_letter(self, letter=None):
+        if self.closing or self.actors.live_count >= config.letter_count:
+            return None
+
+        if letter is None:
+            letter = self.word_index.random_letter(self.rng)
+        creation_angle = 2. * pi * self.rng.random()
+        position = (config.creation_distance *
+                    b2Vec2(cos(creation_angle), sin(creation_angle)))
+        angle = 2 * pi * self.rng.random()
+        radius = (config.min_radius +
+                  self.rng.random() * (config.max_radius - config.min_radius))
+        body = create_letter_body(self.world, position, angle, radius,
+                                  config.spring_joints)
+        actor = self.actors.add(letter, radius, body, position.x, position.y,
+                                angle)
+        body.userData = actor
+        if config.spring_joints:
+            self.actors.springs[actor] = create_center_spring(self.world,
+                                                              body)
+        if self.solver is not None:
+            self.solver.add(letter)
+        self.letter_grid.invalidate()
+        self._invalidate_letters()
+        return actor
+
+    # At most max_substeps ticks are taken per step, so that a stall cannot
+    # snowball into ever longer steps. The rest of the backlog is either
+    # dropped, or kept so that the game runs slow until it has caught up.
+    def step(self, dt):
+        if config.catch_up not in ('drop', 'slow'):
+            raise ValueError('Unknown catch-up policy: %r' % config.catch_up)
+        self.screen_time += dt
+        substeps = 0
+        while (self.world_time + config.time_step <= self.screen_time and
+               substeps < config.max_substeps):
+            self.tick()
+            substeps += 1
+        if (config.catch_up == 'drop' and
+            self.world_time + config.time_step <= self.screen_time):
+            self.screen_time = self.world_time
+        self.profiler.record('step.substeps', substeps)
+
+    # How far the screen time is between the previous and the current tick.
+    def get_interpolation(self):
+        if not config.interpolate:
+            return 1.
+        alpha = (self.screen_time - self.world_time) / config.time_step
+        return min(max(alpha, 0.), 1.)
+
+    # Yields every actor with its position and angle as they should be drawn,
+    # interpolated between the previous and the current tick.
+    def iter_states(self):
+        alpha = self.get_interpolation()
+        actors = self.actors
+        bodies = actors.bodies
+        xs, ys, angles = actors.xs, actors.ys, actors.angles
+        for actor in actors.ids:
+            body = bodies[actor]
+            x, y = body.position.tuple()
+            angle = body.angle
+            if alpha < 1.:
+                x = xs[actor] + alpha * (x - xs[actor])
+                y = ys[actor] + alpha * (y - ys[actor])
+                angle = angles[actor] + alpha * (angle - angles[actor])
+            yield actor, x, y, angle
+
+    def _save_states(self):
+        actors = self.actors
+        bodies = actors.bodies
+        xs, ys, angles = actors.xs, actors.ys, actors.angles
+        for actor in actors.ids:
+            body = bodies[actor]
+            xs[actor], ys[actor] = body.position.tuple()
+            angles[actor] = body.angle
+
+    def tick(self):
+        profiler = self.profiler
+        start = profiler.start()
+        self.tick_count += 1
+        self.world_time += config.time_step
+        if config.interpolate:
+            self._save_states()
+        if self.world_time > self.time_limit:
+            self.closing = True
+            self.clear_letters()
+        elif (self.level <= len(config.levels) and
+              self.letter_count >= config.levels[self.level - 1]):
+            self.level += 1
+            self.time_limit += config.extra_time
+            self.clear_letters()
+        start = profiler.lap('tick.rules', start)
+        if config.spring_joints:
+            apply_destroy_forces(self.actors)
+        else:
+            apply_spring_forces(self.actors)
+        start = profiler.lap('tick.spring_forces', start)
+        self.world.Step(config.time_step, 10, 8)
+        start = profiler.lap('tick.world_step', start)
+        violators = self.boundary_listener.violators
+        profiler.record('tick.bodies', len(self.actors))
+        profiler.record('tick.violators', len(violators))
+        for actor in violators:
+            self._destroy_actor(actor)
+        violators.clear()
+        self.letter_grid.invalidate()
+        profiler.lap('tick.destroy', start)
+
+    # Destroys every letter in one pass over the store. Nothing stays
+    # selected, since only live letters can be.
+    def clear_letters(self):
+        self.selection.clear()
+        self.cursor.clear()
+        destroyed = self.actors.destroy_all()
+        if destroyed:
+            self._invalidate_letters()
+            self.letter_grid.invalidate()
+            if self.solver is not None:
+                self.solver.clear()
+        for actor in destroyed:
+            self._remove_spring(actor)
+
+    def _invalidate_letters(self):
+        self.letters_version += 1
+        self.hint_engine.invalidate()
+
+    def _clear_letter(self, actor):
+        actors = self.actors
+        if actors.states[actor] != LIVE:
+            return
+        self._invalidate_letters()
+        if actor in self.selection:
+            if actor == self.selection.last():
+                self.selection.pop()
+                self.cursor.pop()
+            else:
+                self.selection.remove(actor)
+                self.cursor.reset(actors.get_letter(a)
+                                  for a in self.selection)
+        if self.solver is not None:
+            self.solver.remove(actors.get_letter(actor))
+        actors.destroy(actor)
+        self.letter_grid.invalidate()
+        self._remove_spring(actor)
+
+    # Destroyed letters are pushed out from Python instead.
+    def _remove_spring(self, actor):
+        actors = self.actors
+        if actors.springs[actor] is not None:
+            self.world.DestroyJoint(actors.springs[actor])
+            actors.springs[actor] = None
+
+    # Removed actors leave their sprites hidden in the store's pool, for the
+    # view to reuse with the next actor that gets the same id.
+    def _destroy_actor(self, actor):
+        actors = self.actors
+        self._clear_letter(actor)
+        self.world.DestroyBody(actors.bodies[actor])
+        if actors.sprites[actor] is not None:
+            actors.sprites[actor].visible = False
+        actors.remove(actor)
+
+class MyBoundaryListener(b2BoundaryListener):
+    def __init__(self):
+        super(MyBoundaryListener, self).__init__()
+        # Ordered, so that bodies are destroyed in the same order on replay.
+        self.violators = OrderedSet()
+
+    def Violation(self, body):
+        actor = body.userData
+        if actor is not None:
+            self.violators.add(actor)
+
+class OrderedSet(object):
+    def __init__(self):
+        self._items = OrderedDict()
+
+    def __contains__(self, item):
+        return item in self._items
+
+    def __iter__(self):
+        return iter(self._items)
+
+    def __len__(self):
+        return len(self._items)
+
+    def add(self, item):
+        self._items[item] = None
+
+    def remove(self, item):
+        del self._items[item]
+
+    def pop(self):
+        return self._items.popitem()[0]
+
+    def last(self):
+        return next(reversed(self._items))
+
+    def clear(self):
+        self._items.clear()
+
+# Caches the nearest actor for every letter that continues the selection.
+# The hints are recomputed when invalidated, which the game does whenever the
+# selection or the letters change, or when the last selected actor or a
+# hinted actor has moved further than the threshold.
+class HintEngine(object):
+    def __init__(self, threshold):
+        self.threshold = threshold
+        self.actors = frozenset()
+        self.stale = True
+        self._anchor = 0., 0.
+        self._positions = []
+
+    def invalidate(self):
+        self.stale = True
+
+    def update(self, letters, find_actor, anchor, bodies):
+        anchor = anchor.tuple()
+        if not self.stale and not self._moved(anchor, bodies):
+            return False
+        self.stale = False
+        actors = set()
+        for letter in letters:
+            actor = find_actor(letter)
+            if actor is not None:
+                actors.add(actor)
+        self._anchor = anchor
+        self._positions = [(a, bodies[a].position.tuple()) for a in actors]
+        changed = actors != self.actors
+        self.actors = frozenset(actors)
+        return changed
+
+    def _moved(self, anchor, bodies):
+        threshold_squared = self.threshold ** 2
+        if _distance_squared(anchor, self._anchor) > threshold_squared:
+            return True
+        for actor, position in self._positions:
+            if (_distance_squared(bodies[actor].position.tuple(), position) >
+                threshold_squared):
+                return True
+        return False
+
+def _distance_squared(a, b):
+    return (b[0] - a[0]) ** 2 + (b[1] - a[1]) ** 2
+
+def create_world():
+    aabb = b2AABB()
+    aabb.lowerBound = -config.world_radius, -config.world_radius
+    aabb.upperBound = config.world_radius, config.world_radius
+    return b2World(aabb, (0., 0.), True)
+
+# Box2D copies the definitions when it creates a body, so one of each is
+# reused for every letter. Box2D 2.0 recycles the memory of destroyed bodies
+# itself, and cannot park bodies outside the simulation for later reuse.
+_letter_body_def = b2BodyDef()
+_letter_shape_def = b2CircleDef()
+
+# With damped set, Box2D applies the damping force of the spring itself.
+# It damps velocity at a rate rather than with a force, so the damping is
+# divided by the mass of the circle.
+def create_letter_body(world, position, angle, radius, damped=False):
+    body_def = _letter_body_def
+    body_def.position = position
+    body_def.angle = angle
+    if damped:
+        body_def.linearDamping = (config.damping /
+                                  (config.density * pi * radius ** 2))
+    else:
+        body_def.linearDamping = 0.
+    body = world.CreateBody(body_def)
+    shape_def = _letter_shape_def
+    shape_def.radius = radius
+    shape_def.density = config.density
+    shape_def.restitution = config.restitution
+    shape_def.friction = config.friction
+    body.CreateShape(shape_def)
+    body.SetMassFromShapes()
+    return body
+
+# Spring and damping forces toward the nucleus, or away from it for destroyed
+# letters, applied from Python on every step.
+def apply_spring_forces(actors):
+    states = actors.states
+    bodies = actors.bodies
+    for actor in actors.ids:
+        body = bodies[actor]
+        if states[actor] == LIVE:
+            force = -(config.spring_constant *
+                      body.GetWorldCenter() +
+                      config.damping * body.GetLinearVelocity())
+        else:
+            direction = body.GetWorldCenter().copy()
+            direction.Normalize()
+            force = (config.destroy_force * direction -
+                    config.damping * body.GetLinearVelocity())
+        body.ApplyForce(force, body.GetWorldCenter())
+
+# The push on destroyed letters when the springs are joints. The damping is
+# left to Box2D.
+def apply_destroy_forces(actors):
+    bodies = actors.bodies
+    for actor in actors.destroyed_ids:
+        body = bodies[actor]
+        direction = body.GetWorldCenter().copy()
+        direction.Normalize()
+        body.ApplyForce(config.destroy_force * direction,
+                        body.GetWorldCenter())
+
+# Native alternative to the spring force of apply_spring_forces, for bodies
+# created with damping. A soft distance joint of zero length pulls the
+# center of mass toward the nucleus. Box2D derives the stiffness of the
+# joint from its frequency and the mass of the body, so the frequency is
+# chosen to give the configured spring constant. Unlike a mouse joint, it
+# neither clamps the force nor damps the rotation.
+def create_center_spring(world, body):
+    joint_def = b2DistanceJointDef()
+    joint_def.body1 = world.GetGroundBody()
+    joint_def.body2 = body
+    joint_def.localAnchor1 = 0., 0.
+    joint_def.localAnchor2 = body.GetLocalCenter()
+    joint_def.length = 0.
+    joint_def.frequencyHz = (sqrt(config.spring_constant / body.GetMass()) /
+                             (2. * pi))
+    joint_def.dampingRatio = 0.
+    return world.CreateJoint(joint_def).getAsType()
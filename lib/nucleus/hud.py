@@ -0,0 +1,128 @@
+import sprite
+import pyglet
+import time
+
+# A HUD field is a static caption, laid out once as a label, followed by a
+# value drawn as a run of glyph sprites. Every character of the value has a
+# slot of fixed width, so a new value only swaps the glyph images of the
+# slots that changed and never lays out text again. Values are compared
+# before they are formatted, so an unchanged value costs one comparison.
+
+class HudField(object):
+    def __init__(self, caption, format_value, x, y, font_size,
+                 font_name=None, bold=False, anchor_x='left',
+                 anchor_y='baseline', batch=None, charset=u'0123456789:/'):
+        font = pyglet.font.load(font_name, font_size, bold=bold)
+        self.format_value = format_value
+        self.x = x
+        self.anchor_x = anchor_x
+        self.batch = batch
+        self.value = None
+        self.text = None
+        self.baseline = _get_baseline(font, y, anchor_y)
+        self.glyphs = dict(zip(charset, font.get_glyphs(charset)))
+        self.slot_width = max(g.advance for g in self.glyphs.itervalues())
+        self.sprites = []
+        self.run_x = x
+        self.caption = pyglet.text.Label(caption,
+                                         font_name=font_name,
+                                         font_size=font_size,
+                                         bold=bold,
+                                         x=x, y=self.baseline,
+                                         anchor_y='baseline',
+                                         batch=batch)
+
+    def set_value(self, value):
+        if value == self.value:
+            return
+        self.value = value
+        text = self.format_value(value)
+        if text == self.text:
+            return
+        if self.text is None or len(text) != len(self.text):
+            self._layout(text)
+        else:
+            for i, (old_char, char) in enumerate(zip(self.text, text)):
+                if char != old_char:
+                    self._set_char(i, char)
+        self.text = text
+
+    # The caption only moves, and is laid out again, when the length of the
+    # value changes and the field is not left anchored.
+    def _layout(self, text):
+        while len(self.sprites) < len(text):
+            slot_sprite = sprite.Sprite(self.glyphs.itervalues().next(),
+                                        batch=self.batch)
+            self.sprites.append(slot_sprite)
+        for slot_sprite in self.sprites[len(text):]:
+            slot_sprite.visible = False
+        caption_width = self.caption.content_width
+        run_width = len(text) * self.slot_width
+        if self.anchor_x == 'right':
+            caption_x = self.x - run_width - caption_width
+        elif self.anchor_x == 'center':
+            caption_x = self.x - (caption_width + run_width) // 2
+        else:
+            caption_x = self.x
+        if caption_x != self.caption.x:
+            self.caption.x = caption_x
+        self.run_x = caption_x + caption_width
+        for i, char in enumerate(text):
+            self._set_char(i, char)
+
+    def _set_char(self, i, char):
+        slot_sprite = self.sprites[i]
+        glyph = self.glyphs.get(char)
+        if glyph is None:
+            slot_sprite.visible = False
+            return
+        slot_sprite.image = glyph
+        slot_sprite.visible = True
+        left = (self.run_x + i * self.slot_width +
+                (self.slot_width - glyph.advance) // 2)
+        slot_sprite.position = (left + glyph.vertices[0] + glyph.anchor_x,
+                                self.baseline + glyph.vertices[1] +
+                                glyph.anchor_y)
+
+# Lists the percentiles of every profiler series. The text is laid out
+# again only every refresh interval, so the overlay hardly shows up in the
+# frame times it reports.
+class ProfileOverlay(object):
+    def __init__(self, profiler, x, y, font_size, width, refresh_interval=0.5,
+                 timer=time.time):
+        self.profiler = profiler
+        self.refresh_interval = refresh_interval
+        self.timer = timer
+        self.refresh_time = None
+        self.label = pyglet.text.Label(u'', font_name='Courier New',
+                                       font_size=font_size, x=x, y=y,
+                                       anchor_y='top', width=width,
+                                       multiline=True)
+
+    def draw(self):
+        now = self.timer()
+        if (self.refresh_time is None or
+            now - self.refresh_time >= self.refresh_interval):
+            self.refresh_time = now
+            self.label.text = self._format()
+        self.label.draw()
+
+    def _format(self):
+        lines = [u'%-24s %8s %8s %8s %8s' % (u'', u'unit', u'p50', u'p95',
+                                             u'p99')]
+        for name in sorted(self.profiler.series):
+            summary = self.profiler.summarize(name)
+            lines.append(u'%-24s %8s %8.3f %8.3f %8.3f' % (
+                name, summary['unit'], summary['p50'], summary['p95'],
+                summary['p99']))
+        return u'\n'.join(lines)
+
+def _get_baseline(font, y, anchor_y):
+    if anchor_y == 'top':
+        return y - font.ascent
+    elif anchor_y == 'bottom':
+        return y - font.descent
+    elif anchor_y == 'center':
+        return y - (font.ascent + font.descent) // 2
+    else:
+        return y
@@ -1,11 +1,19 @@
 from __future__ import with_statement
 
+from actors import LIVE
+from atlas import load_glyph_atlas
+from bot import create_bot
+from capture import FrameCapture
 import config
+from game import Game, WordIndexLoader, require_data_dir
+import hud
+from profiler import Profiler, null_profiler
+from replay import Recording
 import sprite
+from writer import FileWriter
 from Box2D import *
 import pyglet
 from pyglet.gl import *
-import codecs
 from collections import *
 from itertools import *
 from math import *
@@ -22,93 +30,46 @@ pyglet.sprite.Sprite = sprite.Sprite
 def _(phrase):
     return phrase
 
-def get_data_dir():
-    data_dir = os.environ.get('NUCLEUS_DATA_DIR')
-    if data_dir is not None:
-        return data_dir
-    data_dir = os.path.dirname(os.path.abspath(__file__))
-    while True:
-        new_data_dir = os.path.join(data_dir, 'data')
-        if os.path.exists(new_data_dir):
-            return new_data_dir
-        new_data_dir = os.path.dirname(data_dir)
-        if new_data_dir == data_dir:
-            return None
-        data_dir = new_data_dir
-
-class WordIndex(object):
-    def __init__(self, words):
-        self.letter_tree = {}
-        self.letter_counts = defaultdict(int)
-        for word in words:
-            self.add_word(word)
-
-    def add_word(self, word):
-        tree = self.letter_tree
-        for letter in word:
-            self.letter_counts[letter] += 1
-            tree = tree.setdefault(letter, {})
-        tree[u''] = None
-
-    def complete(self, prefix):
-        tree = self.letter_tree
-        for letter in prefix:
-            if letter in tree:
-                tree = tree[letter]
-            else:
-                return set()
-        return set(tree)
-
-    def random_letter(self):
-        total_count = sum(self.letter_counts.values())
-        random_count = random.randrange(total_count)
-        for letter, count in self.letter_counts.items():
-            if random_count < count:
-                return letter
-            random_count -= count
-        return None
-
-    @staticmethod
-    def parse(path, encoding='ASCII'):
-        def read_words():
-            alphabet = set(config.alphabet)
-            with codecs.open(path, 'r', encoding) as file_obj:
-                for line in file_obj:
-                    word = line.strip().upper()
-                    if word and not set(word) - alphabet:
-                        yield word
-        return WordIndex(read_words())
-
-    @staticmethod
-    def load(path):
-        with open(path) as word_index_file:
-            return pickle.load(word_index_file)
-
-    def save(self, path):
-        with open(path, 'w') as word_index_file:
-            pickle.dump(self, word_index_file, pickle.HIGHEST_PROTOCOL)
-
 class MyWindow(pyglet.window.Window):
-    def __init__(self, word_index, data_dir, **kwargs):
+    def __init__(self, data_dir, **kwargs):
         super(MyWindow, self).__init__(**kwargs)        
         if self.fullscreen:
             self.set_exclusive_mouse()
 
-        self.word_index = word_index
+        self.word_index = None
         self.data_dir = data_dir
         self.highscores_path = os.path.join(data_dir, 'highscores.pickle')
         self.screenshot_path = os.path.join(data_dir, 'screenshot.png')
+        self.recording_path = os.path.join(data_dir, 'recording.pickle')
+        self.profile_path = os.path.join(data_dir, 'profile.json')
+        if config.profile:
+            self.profiler = Profiler(config.profile_size)
+        else:
+            self.profiler = null_profiler
+        self.file_writer = FileWriter()
+        if config.capture:
+            self.frame_capture = FrameCapture(
+                os.path.join(data_dir, 'capture'), self.width, self.height,
+                config.capture_interval, config.capture_queue_size)
+        else:
+            self.frame_capture = None
         self.scale = self.height / config.view_height
-        self.font = pyglet.font.load(name=config.font_name,
-                                     size=(self.scale * config.font_scale),
-                                     bold=config.font_bold)
+        if config.save_glyph_atlas:
+            glyph_atlas_path = os.path.join(data_dir, 'glyph-atlas.pickle')
+        else:
+            glyph_atlas_path = None
+        self.glyph_atlas = load_glyph_atlas(glyph_atlas_path,
+                                            config.font_name,
+                                            self.scale * config.font_scale,
+                                            config.font_bold,
+                                            config.alphabet)
         self._init_highscores()
         self._init_gl()
-        self.my_screen = TitleScreen(self)
+        self.my_screen = LoadingScreen(self, WordIndexLoader(data_dir))
 
     def _init_highscores(self):
         if config.save_highscores and os.path.exists(self.highscores_path):
-            with open(self.highscores_path) as highscores_file:
+            with open(self.highscores_path, 'rb') as highscores_file:
                 self.highscores = pickle.load(highscores_file)
         else:
             self.highscores = []
@@ -120,29 +81,130 @@ class MyWindow(pyglet.window.Window):
         self.highscores.sort(reverse=True)
         self.highscores = self.highscores[:5]
         if save and config.save_highscores:
-            with open(self.highscores_path, 'w') as highscores_file:
-                pickle.dump(self.highscores, highscores_file,
-                            pickle.HIGHEST_PROTOCOL)
+            highscores = list(self.highscores)
+            self.file_writer.write(
+                self.highscores_path,
+                lambda highscores_file: pickle.dump(highscores,
+                                                    highscores_file,
+                                                    pickle.HIGHEST_PROTOCOL))
 
     def _init_gl(self):
         clear_color = [float(c) / 255. for c in config.background_color]
         clear_color.append(1.)
         glClearColor(*clear_color)
 
+    def close(self):
+        if self.frame_capture is not None:
+            self.frame_capture.close()
+            print ('Captured %d of %d frames, dropped %d.' %
+                   (self.frame_capture.written, self.frame_capture.frame_count,
+                    self.frame_capture.dropped))
+            self.frame_capture = None
+        super(MyWindow, self).close()
+
     def on_draw(self):
         self.my_screen.on_draw()
-
+        if self.frame_capture is not None:
+            start = self.profiler.start()
+            self.frame_capture.capture()
+            self.profiler.lap('frame.capture', start)
+        self.report_writes()
+
+    # The pixels are read back here, since that needs the GL context, and
+    # encoded by the file writer.
     def on_key_press(self, symbol, modifiers):
         if (symbol == pyglet.window.key.S and
             modifiers & pyglet.window.key.MOD_ACCEL):
             color_buffer = pyglet.image.get_buffer_manager().get_color_buffer()
-            color_buffer.save(self.screenshot_path)
+            image_data = color_buffer.get_image_data()
+            path = self.screenshot_path
+            self.file_writer.write(
+                path, lambda screenshot_file: image_data.save(path,
+                                                              screenshot_file))
         else:
             self.my_screen.on_key_press(symbol, modifiers)
 
     def on_text(self, text):
         self.my_screen.on_text(text)
 
+    # Collects the finished writes on the main thread, since the profiler is
+    # not thread-safe.
+    def report_writes(self):
+        profiler = self.profiler
+        profiler.record('io.queue', self.file_writer.pending)
+        for path, wait, duration, error in self.file_writer.pop_completed():
+            profiler.record_duration('io.wait', wait)
+            profiler.record_duration('io.write', duration)
+            if error is not None:
+                sys.stderr.write('Cannot write %s: %s\n' % (path, error))
+
+# Shows the progress of the word index loader, and hands over to the title
+# screen as soon as the index is ready.
+class LoadingScreen(object):
+    def __init__(self, window, loader):
+        self.window = window
+        self.loader = loader
+        self.batch = pyglet.graphics.Batch()
+        self.status = None
+        self.label = pyglet.text.Label(u'',
+                                       font_size=(self.window.scale / 1.5),
+                                       bold=config.font_bold,
+                                       x=(self.window.width // 2),
+                                       y=(self.window.height // 2 +
+                                          self.window.scale),
+                                       anchor_x='center',
+                                       anchor_y='bottom',
+                                       batch=self.batch)
+        self._update_label()
+        pyglet.clock.schedule(self.update)
+
+    def close(self):
+        pyglet.clock.unschedule(self.update)
+
+    def update(self, dt):
+        if self.loader.done:
+            self.close()
+            self.window.word_index = self.loader.get_word_index()
+            self.window.my_screen = TitleScreen(self.window)
+        else:
+            self._update_label()
+
+    def _update_label(self):
+        status = (self.loader.message or 'Loading...',
+                  int(100. * self.loader.fraction))
+        if status != self.status:
+            self.status = status
+            self.label.text = u'%s %d%%' % (_(status[0]), status[1])
+
+    def on_draw(self):
+        self.window.clear()
+        self.batch.draw()
+        self._draw_progress_bar()
+
+    def _draw_progress_bar(self):
+        width = self.window.width // 2
+        height = self.window.scale / 2.
+        left = (self.window.width - width) // 2
+        bottom = self.window.height // 2 - height
+        right = left + width * self.loader.fraction
+        top = bottom + height
+        glColor3ub(*config.color)
+        pyglet.graphics.draw(5, GL_LINE_STRIP,
+                             ('v2f', (left, bottom, left + width, bottom,
+                                      left + width, top, left, top,
+                                      left, bottom)))
+        pyglet.graphics.draw(4, GL_QUADS,
+                             ('v2f', (left, bottom, right, bottom,
+                                      right, top, left, top)))
+
+    def on_key_press(self, symbol, modifiers):
+        if symbol == pyglet.window.key.ESCAPE:
+            self.close()
+            self.window.on_close()
+
+    def on_text(self, text):
+        pass
+
 class TitleScreen(object):
     def __init__(self, window):
         self.window = window
@@ -204,36 +266,48 @@ class TitleScreen(object):
 class GameScreen(object):
     def __init__(self, window):
         self.window = window
-        self.closing = False
-        self.actors = set()
-        self.letter_sets = defaultdict(set)
-        self.selection = []
-        self.batch = pyglet.graphics.Batch()
-        self.score = 0
-
-        self.screen_time = 0.
-        self.world_time = 0.
-
-        self.level = 1
-        self.time_limit = config.time_limit
-
-        self.letter_count = 0
-
-        self.world = self._create_world()
-        self.boundary_listener = MyBoundaryListener()
-        self.world.SetBoundaryListener(self.boundary_listener)
-
+        seed = random.randrange(2 ** 32)
+        self.game = Game(window.word_index, random.Random(seed),
+                         window.profiler)
+        if config.record_sessions:
+            self.recording = Recording(seed)
+        else:
+            self.recording = None
+        if config.bot is not None:
+            self.bot = create_bot(config.bot, config.bot_typing_speed)
+        else:
+            self.bot = None
+        self.colors_version = None
+        self.batch = sprite.Batch()
+        if config.sprite_arrays and sprite.numpy is not None:
+            self.sprite_arrays = {}
+        else:
+            self.sprite_arrays = None
         self.circle_vertex_list = self._create_circle_vertex_list()
 
         self._init_labels()
+        if config.profile_overlay and window.profiler.enabled:
+            font_size = window.scale / 2.
+            self.profile_overlay = hud.ProfileOverlay(
+                window.profiler, font_size, window.height - 4. * font_size,
+                font_size, width=window.width)
+        else:
+            self.profile_overlay = None
 
-        pyglet.clock.schedule_interval(self.step, config.time_step)
+        # Stepped once per frame, so that every frame is drawn with the
+        # interpolation for its own screen time. The game takes fixed ticks
+        # as the screen time allows.
+        pyglet.clock.schedule(self.step)
         pyglet.clock.schedule_interval(self.create_letter,
                                        config.creation_interval)
 
     def close(self):
         pyglet.clock.unschedule(self.step)
         pyglet.clock.unschedule(self.create_letter)
+        self.game.close()
+        if self.recording is not None:
+            self.recording.finish(self.game)
+            self.recording.save(self.window.recording_path)
         self.window.my_screen = TitleScreen(self.window)
 
     def _init_labels(self):
@@ -242,168 +316,188 @@ class GameScreen(object):
         right = self.window.width - font_size
         bottom = font_size
         left = font_size
-        self.level_label = pyglet.text.Label(font_size=font_size,
-                                             bold=config.font_bold,
-                                             x=left, y=top,
-                                             anchor_x='left',
-                                             anchor_y='top',
-                                             batch=self.batch)
-        self.letters_label = pyglet.text.Label(font_size=font_size,
-                                               bold=config.font_bold,
-                                               x=right, y=top,
-                                               anchor_x='right',
-                                               anchor_y='top',
-                                               batch=self.batch)
-        self.score_label = pyglet.text.Label(font_size=font_size,
-                                             bold=config.font_bold,
-                                             x=left, y=bottom,
-                                             batch=self.batch)
-        self.time_label = pyglet.text.Label(font_size=font_size,
-                                            bold=config.font_bold,
-                                            x=right, y=bottom,
-                                            anchor_x='right',
-                                            batch=self.batch)
+        self.level_field = hud.HudField(u'%s: ' % _('Level'), unicode,
+                                        left, top, font_size,
+                                        bold=config.font_bold,
+                                        anchor_x='left', anchor_y='top',
+                                        batch=self.batch)
+        self.letters_field = hud.HudField(u'%s: ' % _('Letters'),
+                                          format_letters, right, top,
+                                          font_size, bold=config.font_bold,
+                                          anchor_x='right', anchor_y='top',
+                                          batch=self.batch)
+        self.score_field = hud.HudField(u'%s: ' % _('Score'), unicode,
+                                        left, bottom, font_size,
+                                        bold=config.font_bold,
+                                        batch=self.batch)
+        self.time_field = hud.HudField(u'%s: ' % _('Time'), format_time,
+                                       right, bottom, font_size,
+                                       bold=config.font_bold,
+                                       anchor_x='right', batch=self.batch)
         self._update_labels()
 
-    def _create_world(self):
-        aabb = b2AABB()
-        aabb.lowerBound = -config.world_radius, -config.world_radius
-        aabb.upperBound = config.world_radius, config.world_radius
-        return b2World(aabb, (0., 0.), True)
-
-    def format_time(self):
-        seconds = max(int(self.time_limit - self.world_time), 0)
-        minutes, seconds = divmod(seconds, 60)
-        return '%d:%02d' % (minutes, seconds)
-
     def on_key_press(self, symbol, modifiers):
+        if self.recording is not None:
+            self.recording.add_event(self.game, 'key',
+                                     pyglet.window.key.symbol_string(symbol))
         if symbol == pyglet.window.key.ESCAPE:
             self.close()
         elif symbol == pyglet.window.key.BACKSPACE:
-            if self.selection:
-                self.selection.pop()
+            self.game.deselect_letter()
         elif symbol == pyglet.window.key.ENTER:
-            word = u''.join(a.letter for a in self.selection)
-            if u'' in self.window.word_index.complete(word):
+            word = self.game.submit_word()
+            if word is not None:
                 print word
-                multiplier = 1
-                score = len(self.selection)
-                self.letter_count += len(self.selection)
-                for i, actor in enumerate(self.selection):
-                    for other in self.selection[i + 1:]:
-                        if ((actor.body.GetWorldCenter() -
-                             other.body.GetWorldCenter()).LengthSquared()
-                             < (actor.radius + other.radius + 0.5) ** 2):
-                             multiplier += 1
-                for actor in list(self.selection):
-                    self._clear_letter(actor)
-                self.score += multiplier * score
-            else:
-                del self.selection[:]
 
     def on_text(self, text):
-        for letter in text.upper():
-            actors = self.letter_sets[letter] - set(self.selection)
-            if actors:
-                self.selection.append(min(actors, key=self.get_actor_key))
-
-    def get_last_position(self):
-        if self.selection:
-            return self.selection[-1].body.position
-        else:
-            return b2Vec2(0., 0.)
-
-    def get_actor_key(self, actor):
-        return (actor.body.position - self.get_last_position()).LengthSquared()
+        if self.recording is not None:
+            self.recording.add_event(self.game, 'text', text)
+        self.game.select_letters(text)
 
     def create_letter(self, dt):
-        letter_count = sum(len(s) for s in self.letter_sets.values())
-        if self.closing or letter_count >= config.letter_count:
+        profiler = self.window.profiler
+        start = profiler.start()
+        actor = self.game.create_letter()
+        if actor is None:
             return
-
-        letter = self.window.word_index.random_letter()
-        body_def = b2BodyDef()
-        creation_angle = 2. * pi * random.random()
-        body_def.position = (config.creation_distance *
-                             b2Vec2(cos(creation_angle), sin(creation_angle)))
-        body_def.angle = 2 * pi * random.random()
-        body = self.world.CreateBody(body_def)
-        shape_def = b2CircleDef()
-        radius = (config.min_radius +
-                  random.random() * (config.max_radius - config.min_radius))
-        shape_def.radius = radius
-        shape_def.density = config.density
-        shape_def.restitution = config.restitution
-        shape_def.friction = config.friction
-        body.CreateShape(shape_def)
-        body.SetMassFromShapes()
-        glyph = self.window.font.get_glyphs(letter)[0]
-        glyph.anchor_x = glyph.width // 2
-        glyph.anchor_y = glyph.height // 2
-        sprite = pyglet.sprite.Sprite(glyph, batch=self.batch,
-                                      subpixel=config.subpixel)
+        if self.recording is not None:
+            self.recording.add_event(self.game, 'create_letter')
+        actors = self.game.actors
+        glyph = self.window.glyph_atlas.glyphs[actors.get_letter(actor)]
+        self._set_letter_sprite(actor, glyph)
         if config.scale_letters:
-            sprite.scale = radius
-        actor = Actor(body, letter, sprite, radius)
-        body.userData = actor
-        self.actors.add(actor)
-        self.letter_sets[letter].add(actor)
+            actors.sprites[actor].scale = actors.radii[actor]
+        profiler.lap('create_letter', start)
+
+    # Reused actor ids come with the hidden sprite of their last letter,
+    # which is shown again with the new glyph unless the glyph is on another
+    # texture than its sprite array.
+    def _set_letter_sprite(self, actor, glyph):
+        sprites = self.game.actors.sprites
+        if self.sprite_arrays is not None:
+            sprite_array = self._get_sprite_array(glyph)
+            if (sprites[actor] is not None and
+                sprites[actor].array is not sprite_array):
+                sprites[actor].delete()
+                sprites[actor] = None
+            if sprites[actor] is None:
+                sprites[actor] = sprite_array.add(glyph)
+                return
+        elif sprites[actor] is None:
+            sprites[actor] = pyglet.sprite.Sprite(glyph, batch=self.batch,
+                                                  subpixel=config.subpixel)
+            return
+        sprites[actor].image = glyph
+        sprites[actor].visible = True
+
+    def _get_sprite_array(self, glyph):
+        texture = glyph.get_texture()
+        sprite_array = self.sprite_arrays.get(texture.id)
+        if sprite_array is None:
+            sprite_array = sprite.SpriteArray(texture, batch=self.batch,
+                                              subpixel=config.subpixel,
+                                              capacity=config.letter_count)
+            self.sprite_arrays[texture.id] = sprite_array
+        return sprite_array
 
     def on_draw(self):
+        profiler = self.window.profiler
+        frame_start = start = profiler.start()
         self.window.clear()
         self._update_sprites()
+        start = profiler.lap('frame.update_sprites', start)
         self._update_labels()
+        start = profiler.lap('frame.update_labels', start)
         self.batch.draw()
+        start = profiler.lap('frame.batch_draw', start)
         if config.debug_draw:
             self._debug_draw()
+            profiler.lap('frame.debug_draw', start)
+        profiler.lap('frame', frame_start)
+        profiler.end_frame()
+        if self.profile_overlay is not None:
+            self.profile_overlay.draw()
 
     def _update_sprites(self):
-        prefix = u''.join(a.letter for a in self.selection)
-        hint_letters = self.window.word_index.complete(prefix)
-        hint_actors = set()
-        if config.hint:
-            for letter in next_letters:
-                actors = self.letter_sets[letter] - set(self.selection)
-                if actors:
-                    hint_actors.add(min(actors, key=self.get_actor_key))
-        for body in self.world.bodyList:
-            actor = body.userData
-            if actor is not None:
-                if actor.letter is None:
-                    actor.sprite.color = config.destroy_color
-                elif actor in self.selection:
-                    if u'' in hint_letters:
-                        actor.sprite.color = config.word_color
-                    elif hint_letters:
-                        actor.sprite.color = config.prefix_color
-                    else:
-                        actor.sprite.color = config.error_color
-                elif actor in hint_actors:
-                    actor.sprite.color = config.hint_color
-                else:
-                    actor.sprite.color = config.color
-                world_x, world_y = body.position.tuple()
-                screen_x = world_x * self.window.scale + self.window.width // 2
-                screen_y = (world_y * self.window.scale +
-                            self.window.height // 2)
-                actor.sprite.position = screen_x, screen_y
-                if config.rotate_letters:
-                    actor.sprite.rotation = -body.angle * 180. / pi
+        hints_changed = config.hint and self.game.update_hints()
+        if hints_changed or self.colors_version != self.game.letters_version:
+            self.colors_version = self.game.letters_version
+            self._update_colors()
+        if self.sprite_arrays is not None:
+            self._update_sprite_arrays()
+        else:
+            self._update_letter_sprites()
+
+    # Letter colors depend only on the selection, the hint actors and which
+    # letters are destroyed, so they are recomputed only when one of those
+    # changes. The recolored sprites are counted per frame.
+    def _update_colors(self):
+        game = self.game
+        self.window.profiler.add('frame.recolored_sprites', len(game.actors))
+        if game.cursor.is_word():
+            selection_color = config.word_color
+        elif game.cursor.is_prefix():
+            selection_color = config.prefix_color
+        else:
+            selection_color = config.error_color
+        states = game.actors.states
+        sprites = game.actors.sprites
+        for actor in game.actors:
+            if states[actor] != LIVE:
+                sprites[actor].color = config.destroy_color
+            elif actor in game.selection:
+                sprites[actor].color = selection_color
+            elif actor in game.hint_engine.actors:
+                sprites[actor].color = config.hint_color
+            else:
+                sprites[actor].color = config.color
+
+    def _update_letter_sprites(self):
+        sprites = self.game.actors.sprites
+        for actor, world_x, world_y, angle in self.game.iter_states():
+            letter_sprite = sprites[actor]
+            screen_x = world_x * self.window.scale + self.window.width // 2
+            screen_y = world_y * self.window.scale + self.window.height // 2
+            if config.rotate_letters:
+                rotation = -angle * 180. / pi
+            else:
+                rotation = letter_sprite.rotation
+            letter_sprite.set_transform(screen_x, screen_y, rotation,
+                                        letter_sprite.scale)
+
+    # Collects the body states once and hands them to the sprite arrays,
+    # which compute all quads in a single vectorized pass. Every array is
+    # updated, since hidden sprites only lose their quads in the update,
+    # even when no actor is left in the array.
+    def _update_sprite_arrays(self):
+        sprites = self.game.actors.sprites
+        states = defaultdict(list)
+        for actor, x, y, angle in self.game.iter_states():
+            letter_sprite = sprites[actor]
+            states[letter_sprite.array].append((letter_sprite.index, x, y,
+                                                angle))
+        for sprite_array in self.sprite_arrays.itervalues():
+            array_states = states.get(sprite_array)
+            if array_states is None:
+                sprite_array.update()
+                continue
+            array_states = sprite.numpy.array(array_states)
+            indices = array_states[:, 0].astype(int)
+            positions = array_states[:, 1:3] * self.window.scale
+            positions[:, 0] += self.window.width // 2
+            positions[:, 1] += self.window.height // 2
+            sprite_array.positions[indices] = positions
+            if config.rotate_letters:
+                rotations = -sprite.numpy.degrees(array_states[:, 3])
+                sprite_array.rotations[indices] = rotations
+            sprite_array.update()
 
     def _update_labels(self):
-        self.level_label.text = u'%s: %d' % (_('Level'), self.level)
-        self._update_letters_label()
-        self.score_label.text = u'%s: %d' % (_('Score'), self.score)
-        self.time_label.text = '%s: %s' % (_('Time'),
-                                          self.format_time())
-
-    def _update_letters_label(self):
-        if self.level <= len(config.levels):
-            letters_text = '%d/%d' % (self.letter_count,
-                                      config.levels[self.level - 1])
-        else:
-            letters_text = str(self.letter_count)
-        self.letters_label.text = u'%s: %s' % (_('Letters'), letters_text)
+        game = self.game
+        self.level_field.set_value(game.level)
+        self.letters_field.set_value((game.letter_count, game.get_goal()))
+        self.score_field.set_value(game.score)
+        self.time_field.set_value(game.get_seconds_left())
 
     def _create_circle_vertex_list(self,
                                    vertex_count=config.circle_vertex_count):
@@ -420,14 +514,14 @@ class GameScreen(object):
         glTranslatef(float(self.window.width // 2),
                      float(self.window.height // 2), 0.)
         glScalef(self.window.scale, self.window.scale, self.window.scale)
-        world_aabb = self.world.GetWorldAABB()
+        world_aabb = self.game.world.GetWorldAABB()
         min_x, min_y = world_aabb.lowerBound.tuple()
         max_x, max_y = world_aabb.upperBound.tuple()
         vertices = (min_x, min_y, max_x, min_y, max_x, max_y, min_x, max_y,
                     min_x, min_y)
         pyglet.graphics.draw(len(vertices) // 2, GL_LINE_STRIP,
                              ('v2f', vertices))
-        for body in self.world.bodyList:
+        for body in self.game.world.bodyList:
             glPushMatrix()
             glTranslatef(body.position.x, body.position.y, 0.)
             glRotatef(body.angle * 180. / pi, 0., 0., 1.)
@@ -446,98 +540,41 @@ class GameScreen(object):
         glPopMatrix()
 
     def step(self, dt):
-        self.screen_time += dt
-        while self.world_time + config.time_step <= self.screen_time:
-            self.world_time += config.time_step
-            if self.world_time > self.time_limit:
-                self.closing = True
-                self.clear_letters()
-            elif (self.level <= len(config.levels) and
-                  self.letter_count >= config.levels[self.level - 1]):
-                self.level += 1
-                self.time_limit += config.extra_time
-                self.clear_letters()
-            for body in self.world.bodyList:
-                actor = body.userData
-                if actor is not None:
-                    if actor.letter is not None:
-                        force = -(config.spring_constant *
-                                  body.GetWorldCenter() +
-                                  config.damping * body.GetLinearVelocity())
-                    else:
-                        direction = body.GetWorldCenter().copy()
-                        direction.Normalize()
-                        force = (config.destroy_force * direction -
-                                config.damping * body.GetLinearVelocity())
-                    body.ApplyForce(force, body.GetWorldCenter())
-            self.world.Step(config.time_step, 10, 8)
-            for actor in self.boundary_listener.violators:
-                self._destroy_actor(actor)
-            self.boundary_listener.violators.clear()
-        if self.closing and not self.actors:
-            self.window.add_highscore(self.score)
+        if self.bot is not None:
+            self.bot.update(self.game, dt, self._send_bot_event)
+        start = self.window.profiler.start()
+        self.game.step(dt)
+        self.window.profiler.lap('step', start)
+        if self.game.over:
+            self.window.add_highscore(self.game.score)
             self.close()
 
-    def clear_letters(self):
-        for body in self.world.bodyList:
-            actor = body.userData
-            if actor is not None:
-                self._clear_letter(actor)
-
-    def _clear_letter(self, actor):
-        if actor in self.selection:
-            self.selection.remove(actor)
-        if actor.letter is not None:
-            self.letter_sets[actor.letter].remove(actor)
-            actor.letter = None
-
-    def _destroy_actor(self, actor):
-        self._clear_letter(actor)
-        self.world.DestroyBody(actor.body)
-        actor.sprite.delete()
-        self.actors.remove(actor)
-
-class MyBoundaryListener(b2BoundaryListener):
-    def __init__(self):
-        super(MyBoundaryListener, self).__init__()
-        self.violators = set()
-
-    def Violation(self, body):
-        actor = body.userData
-        if actor is not None:
-            self.violators.add(actor)
-
-class Actor(object):
-    def __init__(self, body, letter, sprite, radius):
-        self.body = body
-        self.letter = letter
-        self.sprite = sprite
-        self.radius = radius
-
-# TODO: Replace with a loading screen.
-def create_word_index(data_dir):
-    if config.save_word_index:
-        word_index_path = os.path.join(data_dir, 'word-index.pickle')
-        if os.path.exists(word_index_path):
-            print 'Loading word index...'
-            return WordIndex.load(word_index_path)
-    word_list_path = os.path.join(data_dir, config.word_list_file)
-    print 'Indexing word list...'
-    word_index = WordIndex.parse(word_list_path, config.word_list_encoding)
-    if config.save_word_index:
-        print 'Saving word index...'
-        word_index.save(word_index_path)
-    return word_index
+    # Bot events go through the same handlers as the keyboard.
+    def _send_bot_event(self, kind, value):
+        if kind == 'text':
+            self.on_text(value)
+        else:
+            self.on_key_press(getattr(pyglet.window.key, value), 0)
+
+def format_letters(value):
+    letter_count, goal = value
+    if goal is not None:
+        return u'%d/%d' % (letter_count, goal)
+    else:
+        return unicode(letter_count)
+
+def format_time(seconds):
+    minutes, seconds = divmod(seconds, 60)
+    return u'%d:%02d' % (minutes, seconds)
 
 def main():
-    data_dir = get_data_dir()
-    if data_dir is None:
-        sys.stderr.write('Cannot find Nucleus data. Please set environment '
-                         'variable NUCLEUS_DATA_DIR.\n')
-        sys.exit(1)
-    word_index = create_word_index(data_dir)
-    window = MyWindow(word_index, data_dir, fullscreen=config.fullscreen)
+    data_dir = require_data_dir()
+    window = MyWindow(data_dir, fullscreen=config.fullscreen)
     pyglet.app.run()
+    window.file_writer.close()
+    window.report_writes()
+    if config.profile:
+        window.profiler.save(window.profile_path)
 
 if __name__ == '__main__':
     main()
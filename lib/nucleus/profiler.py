@@ -0,0 +1,120 @@
+from __future__ import with_statement
+
+from array import array
+from math import *
+import json
+import time
+
+# Per-frame and per-tick measurements, kept in a fixed-size ring buffer per
+# series so that memory use is bounded however long the game runs. Phases
+# are timed with laps:
+#
+#     start = profiler.start()
+#     update()
+#     start = profiler.lap('frame.update', start)
+#
+# Counters added during a frame are committed as one sample per series by
+# end_frame. The null profiler has the same interface and does nothing, so
+# instrumented code costs a few empty method calls when profiling is off.
+
+class Profiler(object):
+    enabled = True
+
+    def __init__(self, size, timer=time.time):
+        self.size = size
+        self.timer = timer
+        self.series = {}
+        self._durations = set()
+        self._counters = {}
+
+    def start(self):
+        return self.timer()
+
+    def lap(self, name, start):
+        now = self.timer()
+        self.record_duration(name, now - start)
+        return now
+
+    def record_duration(self, name, seconds):
+        self._durations.add(name)
+        self.record(name, seconds)
+
+    def record(self, name, value):
+        series = self.series.get(name)
+        if series is None:
+            series = self.series[name] = RingBuffer(self.size)
+        series.append(value)
+
+    def add(self, name, value=1):
+        self._counters[name] = self._counters.get(name, 0) + value
+
+    # Counters that were seen before and not added to this frame are
+    # committed as zero.
+    def end_frame(self):
+        for name, value in self._counters.iteritems():
+            self.record(name, value)
+            self._counters[name] = 0
+
+    def summarize(self, name):
+        values = sorted(self.series[name])
+        scale = 1e3 if name in self._durations else 1.
+        return dict(unit=('ms' if name in self._durations else 'count'),
+                    samples=len(values),
+                    mean=(scale * sum(values) / max(len(values), 1)),
+                    p50=(scale * percentile(values, 0.5)),
+                    p95=(scale * percentile(values, 0.95)),
+                    p99=(scale * percentile(values, 0.99)),
+                    max=(scale * percentile(values, 1.)))
+
+    def save(self, path):
+        summaries = dict((name, self.summarize(name))
+                         for name in self.series)
+        with open(path, 'w') as profile_file:
+            json.dump(summaries, profile_file, indent=2, sort_keys=True)
+
+class NullProfiler(object):
+    enabled = False
+
+    def start(self):
+        return 0.
+
+    def lap(self, name, start):
+        return 0.
+
+    def record(self, name, value):
+        pass
+
+    def record_duration(self, name, seconds):
+        pass
+
+    def add(self, name, value=1):
+        pass
+
+    def end_frame(self):
+        pass
+
+null_profiler = NullProfiler()
+
+class RingBuffer(object):
+    def __init__(self, size):
+        self._values = array('d', [0.] * size)
+        self._index = 0
+        self._count = 0
+
+    def __len__(self):
+        return self._count
+
+    def __iter__(self):
+        return iter(self._values[:self._count])
+
+    def append(self, value):
+        self._values[self._index] = value
+        self._index = (self._index + 1) % len(self._values)
+        if self._count < len(self._values):
+            self._count += 1
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.
+    index = int(ceil(fraction * len(sorted_values))) - 1
+    return sorted_values[max(index, 0)]
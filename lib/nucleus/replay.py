@@ -0,0 +1,187 @@
+from __future__ import with_statement
+
+import config
+from game import Game, create_word_index, require_data_dir
+from profiler import percentile
+from contextlib import contextmanager
+import cPickle as pickle
+from optparse import OptionParser
+import random
+import sys
+import time
+
+# A recording holds everything a game session depends on: the seed of its
+# random number generator, the configuration and the input events in the
+# order they arrived. Each event is stamped with the number of ticks the game
+# had taken when it arrived, which is what makes replays deterministic, and
+# with the screen time for reference. Keys are recorded by name, so that
+# replays need no window.
+
+# Bump when the recording layout changes.
+format_version = 1
+
+class Recording(object):
+    def __init__(self, seed, settings=None):
+        if settings is None:
+            settings = get_settings()
+        self.seed = seed
+        self.settings = settings
+        self.events = []
+        self.result = None
+
+    def add_event(self, game, kind, value=None):
+        self.events.append((game.tick_count, game.screen_time, kind, value))
+
+    def finish(self, game):
+        self.result = game.tick_count, game.score, game.letter_count
+
+    @staticmethod
+    def load(path):
+        with open(path, 'rb') as recording_file:
+            data = pickle.load(recording_file)
+        if data.get('format_version') != format_version:
+            raise ValueError('Unsupported recording format')
+        recording = Recording(data['seed'], data['settings'])
+        recording.events = data['events']
+        recording.result = data['result']
+        return recording
+
+    def save(self, path):
+        data = dict(format_version=format_version, seed=self.seed,
+                    settings=self.settings, events=self.events,
+                    result=self.result)
+        with open(path, 'wb') as recording_file:
+            pickle.dump(data, recording_file, pickle.HIGHEST_PROTOCOL)
+
+def get_settings():
+    return dict((name, value) for name, value in vars(config).iteritems()
+                if not name.startswith('_'))
+
+@contextmanager
+def applied_settings(settings):
+    saved = get_settings()
+    vars(config).update(settings)
+    try:
+        yield
+    finally:
+        vars(config).update(saved)
+
+def apply_event(game, kind, value):
+    if kind == 'text':
+        game.select_letters(value)
+    elif kind == 'key':
+        if value == 'BACKSPACE':
+            game.deselect_letter()
+        elif value == 'ENTER':
+            game.submit_word()
+    elif kind == 'create_letter':
+        game.create_letter()
+
+# Replays a recording at the fixed time step, as fast as it will go. Returns
+# the game and the time taken by every tick, including the events that
+# arrived before it. The solver is off unless asked for, since its thread
+# would compete with the timed ticks.
+def replay(recording, word_index, timer=time.time, solver=False):
+    events = recording.events
+    if recording.result is not None:
+        tick_count = recording.result[0]
+    elif events:
+        tick_count = events[-1][0]
+    else:
+        tick_count = 0
+    timings = []
+    with applied_settings(dict(recording.settings, solver=solver)):
+        game = Game(word_index, random.Random(recording.seed))
+        try:
+            index = 0
+            for tick in xrange(tick_count):
+                start = timer()
+                while index < len(events) and events[index][0] <= tick:
+                    apply_event(game, events[index][2], events[index][3])
+                    index += 1
+                game.tick()
+                timings.append(timer() - start)
+            for event in events[index:]:
+                apply_event(game, event[2], event[3])
+        finally:
+            game.close()
+    return game, timings
+
+def summarize(timings):
+    sorted_timings = sorted(timings)
+    return (sum(timings) / max(len(timings), 1),
+            percentile(sorted_timings, 0.5),
+            percentile(sorted_timings, 0.95),
+            percentile(sorted_timings, 0.99),
+            percentile(sorted_timings, 1.))
+
+def print_header():
+    print '  %-10s %8s %8s %8s %8s %8s %8s' % ('ms', 'ticks', 'mean', 'p50',
+                                              'p95', 'p99', 'max')
+
+def print_summary(name, timings):
+    print '  %-10s %8s %8.3f %8.3f %8.3f %8.3f %8.3f' % (
+        (name, len(timings)) + tuple(1e3 * t for t in summarize(timings)))
+
+def print_comparison(timings, baseline, tick_count=5):
+    print_header()
+    print_summary('baseline', baseline)
+    print_summary('current', timings)
+    ratios = [c / b if b else float('nan')
+              for c, b in zip(summarize(timings), summarize(baseline))]
+    print '  %-10s %8s %8.2f %8.2f %8.2f %8.2f %8.2f' % (
+        ('ratio', '') + tuple(ratios))
+    slowdowns = sorted(xrange(len(timings)),
+                       key=lambda i: baseline[i] - timings[i])
+    print '  Largest slowdowns:'
+    for i in slowdowns[:tick_count]:
+        print '    tick %6d %8.3f ms -> %8.3f ms' % (i, 1e3 * baseline[i],
+                                                   1e3 * timings[i])
+
+def main(args=sys.argv[1:]):
+    parser = OptionParser(usage='%prog [options] recording')
+    parser.add_option('-n', '--repeat', type='int', default=3,
+                      help='replay N times and keep the fastest time of '
+                           'every tick')
+    parser.add_option('-o', '--output', help='save the tick timings')
+    parser.add_option('-b', '--baseline',
+                      help='compare with tick timings saved earlier')
+    parser.add_option('-s', '--solver', action='store_true', default=False,
+                      help='run the solver during the replay')
+    options, args = parser.parse_args(args)
+    if len(args) != 1:
+        parser.error('expected one recording')
+    data_dir = require_data_dir()
+    recording = Recording.load(args[0])
+    with applied_settings(recording.settings):
+        word_index = create_word_index(data_dir)
+    timings = None
+    for _ in xrange(max(options.repeat, 1)):
+        game, run_timings = replay(recording, word_index,
+                                   solver=options.solver)
+        if timings is None:
+            timings = run_timings
+        else:
+            timings = map(min, timings, run_timings)
+    result = game.tick_count, game.score, game.letter_count
+    if recording.result is not None and result != recording.result:
+        sys.stderr.write('Replay diverged from the recording: %r != %r\n' %
+                         (result, recording.result))
+        sys.exit(1)
+    if options.output is not None:
+        with open(options.output, 'wb') as timings_file:
+            pickle.dump(timings, timings_file, pickle.HIGHEST_PROTOCOL)
+    if options.baseline is not None:
+        with open(options.baseline, 'rb') as baseline_file:
+            baseline = pickle.load(baseline_file)
+        if len(baseline) != len(timings):
+            sys.stderr.write('The baseline has %d ticks, not %d.\n' %
+                             (len(baseline), len(timings)))
+            sys.exit(1)
+        print_comparison(timings, baseline)
+    else:
+        print_header()
+        print_summary('current', timings)
+
+if __name__ == '__main__':
+    main()
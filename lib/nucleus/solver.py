@@ -0,0 +1,129 @@
+from __future__ import with_statement
+
+from collections import *
+import Queue
+import threading
+import time
+
+# Keeps the longest words that can be spelled with the letters on the board
+# up to date. A word scores a point per letter, times a multiplier that
+# depends on where the letters are, so the longest words are also the
+# highest scoring ones. The game reports every letter that comes or goes,
+# and a worker thread applies the queued changes and searches again, within
+# a time budget per search:
+#
+# - If letters were only added, the new words are the ones that use more of
+#   some letter than before, and only those are searched for.
+# - If letters were removed, the best words that can no longer be spelled
+#   are dropped. If any were, the search starts over.
+#
+# A search that runs out of time publishes what it found so far, marked as
+# incomplete, and the next change starts over. The result is a tuple of the
+# words, longest first, and whether the search was complete, replaced as a
+# whole so that it can be read from any thread.
+
+class Solver(object):
+    def __init__(self, word_index, word_count, budget, timer=time.time):
+        self.word_index = word_index
+        self.word_count = word_count
+        self.budget = budget
+        self.timer = timer
+        self.result = (), True
+        self.search_count = 0
+        self.timeout_count = 0
+        self.search_time = 0.
+        self._counts = [0] * len(word_index.alphabet)
+        self._updates = Queue.Queue()
+        self._thread = None
+
+    @property
+    def words(self):
+        return self.result[0]
+
+    @property
+    def complete(self):
+        return self.result[1]
+
+    # True if no word at all can be spelled with the letters on the board.
+    @property
+    def dead(self):
+        words, complete = self.result
+        return complete and not words
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self):
+        self._updates.put(None)
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def add(self, letter):
+        self._updates.put((letter, 1))
+
+    def remove(self, letter):
+        self._updates.put((letter, -1))
+
+    def clear(self):
+        self._updates.put((None, 0))
+
+    def _run(self):
+        while self.update(block=True):
+            pass
+
+    # Applies the queued changes, and searches again if they change the
+    # result. Returns False once stopped.
+    def update(self, block=False):
+        try:
+            updates = [self._updates.get(block)]
+        except Queue.Empty:
+            return True
+        while True:
+            try:
+                updates.append(self._updates.get_nowait())
+            except Queue.Empty:
+                break
+        previous_counts = list(self._counts)
+        letter_indices = self.word_index.letter_indices
+        for update in updates:
+            if update is None:
+                return False
+            letter, delta = update
+            if letter is None:
+                self._counts = [0] * len(self._counts)
+            else:
+                self._counts[letter_indices[letter]] += delta
+        self._search(previous_counts)
+        return True
+
+    def _search(self, previous_counts):
+        counts = self._counts
+        words, complete = self.result
+        required = None
+        if complete:
+            words = [w for w in words if self._spellable(w)]
+            if len(words) == len(self.result[0]):
+                if all(c <= p for c, p in zip(counts, previous_counts)):
+                    return
+                required = map(min, counts, previous_counts)
+        else:
+            words = ()
+        start = self.timer()
+        words, complete = self.word_index.find_longest_words(
+            counts, self.word_count, words, required, start + self.budget,
+            self.timer)
+        self.search_time = self.timer() - start
+        self.search_count += 1
+        if not complete:
+            self.timeout_count += 1
+        self.result = tuple(words), complete
+
+    def _spellable(self, word):
+        letter_indices = self.word_index.letter_indices
+        needed = defaultdict(int)
+        for letter in word:
+            needed[letter_indices[letter]] += 1
+        return all(self._counts[i] >= n for i, n in needed.iteritems())
@@ -0,0 +1,91 @@
+from collections import *
+from math import *
+
+# Uniform grid of actor positions, one bucket per letter, answering
+# "nearest actor with this letter" queries. Cells are searched in rings of
+# growing Chebyshev distance around the query point until no closer actor can
+# be in the next ring. Letters with few actors are scanned linearly instead,
+# which is faster than visiting empty cells. Invalidating drops every bucket,
+# and buckets are rebuilt one letter at a time as they are queried, so that
+# a query costs no more than the actors with its letter.
+
+class LetterGrid(object):
+    def __init__(self, cell_size, scan_limit=8):
+        self.cell_size = float(cell_size)
+        self.scan_limit = scan_limit
+        self._buckets = {}
+
+    def invalidate(self):
+        self._buckets.clear()
+
+    def is_stale(self, letter):
+        return letter not in self._buckets
+
+    # Entries are tuples of x, y and actor.
+    def rebuild(self, letter, entries):
+        cells = None
+        bounds = None
+        if len(entries) > self.scan_limit:
+            cell_size = self.cell_size
+            cells = defaultdict(list)
+            for entry in entries:
+                cell = (int(floor(entry[0] / cell_size)),
+                        int(floor(entry[1] / cell_size)))
+                cells[cell].append(entry)
+            cell_xs = [cx for cx, cy in cells]
+            cell_ys = [cy for cx, cy in cells]
+            bounds = min(cell_xs), min(cell_ys), max(cell_xs), max(cell_ys)
+        self._buckets[letter] = entries, cells, bounds
+
+    def nearest(self, letter, x, y, exclude=()):
+        entries, cells, bounds = self._buckets[letter]
+        if not entries:
+            return None
+        if cells is None:
+            return _nearest_entry(entries, x, y, exclude)
+        min_cx, min_cy, max_cx, max_cy = bounds
+        cell_size = self.cell_size
+        cx = int(floor(x / cell_size))
+        cy = int(floor(y / cell_size))
+        max_ring = max(cx - min_cx, max_cx - cx, cy - min_cy, max_cy - cy)
+        best_actor = None
+        best_distance = None
+        for ring in xrange(max_ring + 1):
+            for cell in _ring_cells(cx, cy, ring):
+                cell_entries = cells.get(cell)
+                if cell_entries:
+                    for entry_x, entry_y, actor in cell_entries:
+                        if actor in exclude:
+                            continue
+                        distance = ((entry_x - x) ** 2 + (entry_y - y) ** 2)
+                        if best_distance is None or distance < best_distance:
+                            best_actor = actor
+                            best_distance = distance
+            # Every cell of the next ring is at least this far away.
+            if (best_distance is not None and
+                best_distance <= (ring * cell_size) ** 2):
+                break
+        return best_actor
+
+def _nearest_entry(entries, x, y, exclude):
+    best_actor = None
+    best_distance = None
+    for entry_x, entry_y, actor in entries:
+        if actor in exclude:
+            continue
+        distance = (entry_x - x) ** 2 + (entry_y - y) ** 2
+        if best_distance is None or distance < best_distance:
+            best_actor = actor
+            best_distance = distance
+    return best_actor
+
+def _ring_cells(cx, cy, ring):
+    if ring == 0:
+        yield cx, cy
+        return
+    for dx in xrange(-ring, ring + 1):
+        yield cx + dx, cy - ring
+        yield cx + dx, cy + ring
+    for dy in xrange(-ring + 1, ring):
+        yield cx - ring, cy + dy
+        yield cx + ring, cy + dy
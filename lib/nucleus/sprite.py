@@ -95,6 +95,7 @@ __version__ = '$Id: sprite.py 2443 2009-03-01 12:07:55Z Alex.Holkner $'
 
 import math
 import sys
+import weakref
 
 from pyglet.gl import *
 from pyglet import clock
@@ -102,8 +103,39 @@ from pyglet import event
 from pyglet import graphics
 from pyglet import image
 
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
 _is_epydoc = hasattr(sys, 'is_epydoc') and sys.is_epydoc
 
+_position_dirty = 1
+_color_dirty = 2
+
+class Batch(graphics.Batch):
+    '''Batch that defers sprite updates until it is drawn.
+
+    Sprites in this batch only mark their transform and color as dirty when
+    a property is set.  The vertices of each dirty sprite are computed once,
+    by `flush`, just before the batch draws.  Sprites in other batches
+    update their vertices immediately.
+    '''
+    def __init__(self):
+        super(Batch, self).__init__()
+        self._dirty_sprites = set()
+
+    def flush(self):
+        '''Write the vertices of all sprites changed since the last flush.'''
+        dirty_sprites = self._dirty_sprites
+        self._dirty_sprites = set()
+        for sprite in dirty_sprites:
+            sprite._flush()
+
+    def draw(self):
+        self.flush()
+        super(Batch, self).draw()
+
 class SpriteGroup(graphics.Group):
     '''Shared sprite rendering group.
 
@@ -113,8 +145,8 @@ class SpriteGroup(graphics.Group):
     def __init__(self, texture, blend_src, blend_dest, parent=None):
         '''Create a sprite group.
 
-        The group is created internally within `Sprite`; applications usually
-        do not need to explicitly create it.
+        The group is created internally by `get_sprite_group`; applications
+        usually do not need to explicitly create it.
 
         :Parameters:
             `texture` : `Texture`
@@ -162,6 +194,35 @@ class SpriteGroup(graphics.Group):
                      self.texture.id, self.texture.target,
                      self.blend_src, self.blend_dest))
 
+_sprite_groups = weakref.WeakValueDictionary()
+
+def get_sprite_group(texture, blend_src, blend_dest, parent=None):
+    '''Get the sprite group for a texture, blend modes and parent group.
+
+    Sprites that would create equal groups share one instance instead, so
+    the batch finds their group by identity.  Groups are held weakly and go
+    away with the last sprite using them.  A group keeps its parent and
+    texture alive, so their ids cannot be reused while it is registered.
+
+    :Parameters:
+        `texture` : `Texture`
+            The (top-level) texture containing the sprite image.
+        `blend_src` : int
+            OpenGL blend source mode.
+        `blend_dest` : int
+            OpenGL blend destination mode.
+        `parent` : `Group`
+            Optional parent group.
+
+    :rtype: `SpriteGroup`
+    '''
+    key = id(parent), texture.id, texture.target, blend_src, blend_dest
+    group = _sprite_groups.get(key)
+    if group is None:
+        group = SpriteGroup(texture, blend_src, blend_dest, parent)
+        _sprite_groups[key] = group
+    return group
+
 class Sprite(event.EventDispatcher):
     '''Instance of an on-screen image.
 
@@ -175,6 +236,7 @@ class Sprite(event.EventDispatcher):
     _scale = 1.0
     _visible = True
     _vertex_list = None
+    _dirty = 0
 
     def __init__(self,
                  img, x=0, y=0,
@@ -228,7 +290,8 @@ class Sprite(event.EventDispatcher):
         else:
             self._texture = img.get_texture()
 
-        self._group = SpriteGroup(self._texture, blend_src, blend_dest, group)
+        self._group = get_sprite_group(self._texture, blend_src, blend_dest,
+                                       group)
         self._usage = usage
         self._subpixel = subpixel
         self._create_vertex_list()
@@ -249,6 +312,9 @@ class Sprite(event.EventDispatcher):
         '''
         if self._animation:
             clock.unschedule(self._animate)
+        if self._dirty and isinstance(self._batch, Batch):
+            self._batch._dirty_sprites.discard(self)
+        self._dirty = 0
         self._vertex_list.delete()
         self._vertex_list = None
         self._texture = None
@@ -279,6 +345,11 @@ class Sprite(event.EventDispatcher):
         if self._batch == batch:
             return
 
+        if self._dirty:
+            if isinstance(self._batch, Batch):
+                self._batch._dirty_sprites.discard(self)
+            self._flush()
+
         if batch is not None and self._batch is not None:
             self._batch.migrate(self._vertex_list, GL_QUADS, self._group, batch)
             self._batch = batch
@@ -304,10 +375,10 @@ class Sprite(event.EventDispatcher):
         if self._group.parent == group:
             return
 
-        self._group = SpriteGroup(self._texture,
-                                  self._group.blend_src,
-                                  self._group.blend_dest,
-                                  group)
+        self._group = get_sprite_group(self._texture,
+                                       self._group.blend_src,
+                                       self._group.blend_dest,
+                                       group)
 
         if self._batch is not None:
             self._batch.migrate(self._vertex_list, GL_QUADS, self._group,
@@ -344,7 +415,7 @@ class Sprite(event.EventDispatcher):
                 clock.schedule_once(self._animate, self._next_dt)
         else:
             self._set_texture(img.get_texture())
-        self._update_position()
+        self._invalidate(_position_dirty)
 
     image = property(_get_image, _set_image,
                      doc='''Image or animation to display.
@@ -354,10 +425,10 @@ class Sprite(event.EventDispatcher):
 
     def _set_texture(self, texture):
         if texture.id is not self._texture.id:
-            self._group = SpriteGroup(texture,
-                                      self._group.blend_src,
-                                      self._group.blend_dest,
-                                      self._group.parent)
+            self._group = get_sprite_group(texture,
+                                           self._group.blend_src,
+                                           self._group.blend_dest,
+                                           self._group.parent)
             if self._batch is None:
                 self._vertex_list.tex_coords[:] = texture.tex_coords
             else:
@@ -384,6 +455,30 @@ class Sprite(event.EventDispatcher):
         self._update_position()
         self._update_color()
 
+    def _invalidate(self, flags):
+        if self._dirty:
+            self._dirty |= flags
+        elif isinstance(self._batch, Batch):
+            self._dirty = flags
+            self._batch._dirty_sprites.add(self)
+        elif self._batch is None:
+            # Flushed by draw.
+            self._dirty = flags
+        elif flags & _position_dirty:
+            self._update_position()
+        else:
+            self._update_color()
+
+    def _flush(self):
+        dirty = self._dirty
+        self._dirty = 0
+        if self._vertex_list is None:
+            return
+        if dirty & _position_dirty:
+            self._update_position()
+        if dirty & _color_dirty:
+            self._update_color()
+
     def _update_position(self):
         img = self._texture
         if not self._visible:
@@ -440,7 +535,27 @@ class Sprite(event.EventDispatcher):
         '''
         self._x = x
         self._y = y
-        self._update_position()
+        self._invalidate(_position_dirty)
+
+    def set_transform(self, x, y, rotation, scale):
+        '''Set the position, rotation and scale of the sprite at once.
+
+        :Parameters:
+            `x` : int
+                X coordinate of the sprite.
+            `y` : int
+                Y coordinate of the sprite.
+            `rotation` : float
+                Clockwise rotation of the sprite, in degrees.
+            `scale` : float
+                Scaling factor.
+
+        '''
+        self._x = x
+        self._y = y
+        self._rotation = rotation
+        self._scale = scale
+        self._invalidate(_position_dirty)
 
     position = property(lambda self: (self._x, self._y),
                         lambda self, t: self.set_position(*t),
@@ -451,7 +566,7 @@ class Sprite(event.EventDispatcher):
 
     def _set_x(self, x):
         self._x = x
-        self._update_position()
+        self._invalidate(_position_dirty)
 
     x = property(lambda self: self._x, _set_x,
                  doc='''X coordinate of the sprite.
@@ -461,7 +576,7 @@ class Sprite(event.EventDispatcher):
 
     def _set_y(self, y):
         self._y = y
-        self._update_position()
+        self._invalidate(_position_dirty)
 
     y = property(lambda self: self._y, _set_y,
                  doc='''Y coordinate of the sprite.
@@ -471,7 +586,7 @@ class Sprite(event.EventDispatcher):
 
     def _set_rotation(self, rotation):
         self._rotation = rotation
-        self._update_position()
+        self._invalidate(_position_dirty)
 
     rotation = property(lambda self: self._rotation, _set_rotation,
                         doc='''Clockwise rotation of the sprite, in degrees.
@@ -484,7 +599,7 @@ class Sprite(event.EventDispatcher):
 
     def _set_scale(self, scale):
         self._scale = scale
-        self._update_position()
+        self._invalidate(_position_dirty)
 
     scale = property(lambda self: self._scale, _set_scale,
                      doc='''Scaling factor.
@@ -524,8 +639,9 @@ class Sprite(event.EventDispatcher):
     ''')
 
     def _set_opacity(self, opacity):
-        self._opacity = opacity
-        self._update_color()
+        if opacity != self._opacity:
+            self._opacity = opacity
+            self._invalidate(_color_dirty)
 
     opacity = property(lambda self: self._opacity, _set_opacity,
                        doc='''Blend opacity.
@@ -542,8 +658,10 @@ class Sprite(event.EventDispatcher):
     ''')
 
     def _set_color(self, rgb):
-        self._rgb = map(int, rgb)
-        self._update_color()
+        rgb = tuple(map(int, rgb))
+        if rgb != self._rgb:
+            self._rgb = rgb
+            self._invalidate(_color_dirty)
 
     color = property(lambda self: self._rgb, _set_color,
                        doc='''Blend color.
@@ -559,7 +677,7 @@ class Sprite(event.EventDispatcher):
 
     def _set_visible(self, visible):
         self._visible = visible
-        self._update_position()
+        self._invalidate(_position_dirty)
 
     visible = property(lambda self: self._visible, _set_visible,
                        '''True if the sprite will be drawn.
@@ -574,6 +692,8 @@ class Sprite(event.EventDispatcher):
         See the module documentation for hints on drawing multiple sprites
         efficiently.
         '''
+        if self._dirty:
+            self._flush()
         self._group.set_state_recursive()
         self._vertex_list.draw(GL_QUADS)
         self._group.unset_state_recursive()
@@ -590,3 +710,310 @@ class Sprite(event.EventDispatcher):
             '''
 
 Sprite.register_event_type('on_animation_end')
+
+class SpriteArray(object):
+    '''Many sprites sharing one texture and one vertex list.
+
+    The sprites are stored as NumPy arrays of positions, rotations, scales
+    and colors.  `update` computes the corners of every quad in one
+    vectorized pass and writes them into a single contiguous vertex list, so
+    there is no per-sprite Python work when a frame is drawn.  Colors are
+    only written when `colors_dirty` is set; `ArraySprite` sets it, code
+    that writes to `colors` directly must set it too.  Requires NumPy.
+    '''
+    def __init__(self, texture,
+                 blend_src=GL_SRC_ALPHA,
+                 blend_dest=GL_ONE_MINUS_SRC_ALPHA,
+                 batch=None,
+                 group=None,
+                 usage='dynamic',
+                 subpixel=False,
+                 capacity=64):
+        '''Create a sprite array.
+
+        :Parameters:
+            `texture` : `Texture`
+                The texture containing the images of all sprites.
+            `blend_src` : int
+                OpenGL blend source mode.
+            `blend_dest` : int
+                OpenGL blend destination mode.
+            `batch` : `Batch`
+                Optional batch to add the sprites to.
+            `group` : `Group`
+                Optional parent group of the sprites.
+            `usage` : str
+                Vertex buffer object usage hint.
+            `subpixel` : bool
+                Allow floating-point coordinates for the sprites.
+            `capacity` : int
+                Initial number of sprites to allocate room for.  The
+                array grows as needed.
+
+        '''
+        if numpy is None:
+            raise ImportError('SpriteArray requires NumPy')
+        self._texture = texture.get_texture()
+        self._group = get_sprite_group(self._texture, blend_src, blend_dest,
+                                       group)
+        self._batch = batch
+        self._usage = usage
+        self._subpixel = subpixel
+        self._size = 0
+        self._free_indices = []
+        self._images = {}
+        self._vertex_list = None
+        self.colors_dirty = True
+
+        self.positions = numpy.zeros((0, 2))
+        self.rotations = numpy.zeros(0)
+        self.scales = numpy.zeros(0)
+        self.colors = numpy.zeros((0, 4), numpy.uint8)
+        self.visible = numpy.zeros(0, bool)
+        self._bounds = numpy.zeros((0, 4))
+        self._tex_coords = numpy.zeros((0, 12), numpy.float32)
+        self._reserve(capacity)
+
+    def _reserve(self, capacity):
+        old_capacity = len(self.scales)
+        if capacity <= old_capacity:
+            return
+        def grow(array):
+            new_array = numpy.zeros((capacity,) + array.shape[1:],
+                                    array.dtype)
+            new_array[:old_capacity] = array
+            return new_array
+        self.positions = grow(self.positions)
+        self.rotations = grow(self.rotations)
+        self.scales = grow(self.scales)
+        self.colors = grow(self.colors)
+        self.visible = grow(self.visible)
+        self._bounds = grow(self._bounds)
+        self._tex_coords = grow(self._tex_coords)
+
+        if self._subpixel:
+            vertex_format = 'v2f/%s' % self._usage
+        else:
+            vertex_format = 'v2i/%s' % self._usage
+        if self._vertex_list is None:
+            if self._batch is None:
+                self._vertex_list = graphics.vertex_list(4 * capacity,
+                    vertex_format, 'c4B', 't3f')
+            else:
+                self._vertex_list = self._batch.add(4 * capacity, GL_QUADS,
+                    self._group, vertex_format, 'c4B', 't3f')
+        else:
+            self._vertex_list.resize(4 * capacity)
+        _as_array(self._vertex_list.tex_coords)[:] = self._tex_coords.ravel()
+        self.colors_dirty = True
+        self._update_vertices(capacity)
+
+    def add(self, img):
+        '''Add a sprite.
+
+        The sprite starts out at the origin, unrotated, unscaled and white.
+
+        :Parameters:
+            `img` : `AbstractImage`
+                Image to display.  It must be stored in the texture of the
+                array.
+
+        :rtype: `ArraySprite`
+        '''
+        self._check_texture(img)
+        if self._free_indices:
+            index = self._free_indices.pop()
+        else:
+            if self._size == len(self.scales):
+                self._reserve(2 * self._size)
+            index = self._size
+            self._size += 1
+        self.positions[index] = 0., 0.
+        self.rotations[index] = 0.
+        self.scales[index] = 1.
+        self.colors[index] = 255
+        self.colors_dirty = True
+        self.visible[index] = True
+        self._set_image(index, img)
+        return ArraySprite(self, index)
+
+    def set_image(self, index, img):
+        '''Change the image of the sprite at an index.
+
+        :Parameters:
+            `index` : int
+                Index of the sprite.
+            `img` : `AbstractImage`
+                Image to display.  It must be stored in the texture of the
+                array.
+
+        '''
+        self._check_texture(img)
+        self._set_image(index, img)
+
+    def _check_texture(self, img):
+        texture = img.get_texture()
+        if (texture.id != self._texture.id or
+            texture.target != self._texture.target):
+            raise ValueError('Image is not in the texture of the array')
+
+    def _set_image(self, index, img):
+        tex_coords = img.get_texture().tex_coords
+        x1 = -img.anchor_x
+        y1 = -img.anchor_y
+        self._bounds[index] = x1, y1, x1 + img.width, y1 + img.height
+        self._tex_coords[index] = tex_coords
+        _as_array(self._vertex_list.tex_coords)[12 * index:
+                                                12 * index + 12] = tex_coords
+        self._images[index] = img
+
+    def remove(self, index):
+        '''Remove the sprite at an index.
+
+        The index is reused by a later `add`.
+        '''
+        self.visible[index] = False
+        self._free_indices.append(index)
+        del self._images[index]
+
+    def update(self):
+        '''Write the vertices, and the colors if changed, of all sprites.'''
+        self._update_vertices(self._size)
+
+    def _update_vertices(self, count):
+        scales = self.scales[:count, numpy.newaxis]
+        bounds = self._bounds[:count] * scales
+        x1, y1, x2, y2 = bounds.T
+        corners_x = numpy.column_stack((x1, x2, x2, x1))
+        corners_y = numpy.column_stack((y1, y1, y2, y2))
+        r = -numpy.radians(self.rotations[:count, numpy.newaxis])
+        cr = numpy.cos(r)
+        sr = numpy.sin(r)
+        vertices = numpy.empty((count, 4, 2))
+        vertices[:, :, 0] = (corners_x * cr - corners_y * sr +
+                             self.positions[:count, 0, numpy.newaxis])
+        vertices[:, :, 1] = (corners_x * sr + corners_y * cr +
+                             self.positions[:count, 1, numpy.newaxis])
+        vertices[~self.visible[:count]] = 0.
+        _as_array(self._vertex_list.vertices)[:8 * count] = vertices.ravel()
+        if self.colors_dirty:
+            self.colors_dirty = False
+            colors = numpy.repeat(self.colors[:count], 4, axis=0)
+            _as_array(self._vertex_list.colors)[:16 * count] = colors.ravel()
+
+    def delete(self):
+        '''Force immediate removal of the sprites from video memory.'''
+        self._vertex_list.delete()
+        self._vertex_list = None
+        self._texture = None
+        self._group = None
+
+    def draw(self):
+        '''Draw all sprites of an array that is not in a batch.'''
+        self._group.set_state_recursive()
+        self._vertex_list.draw(GL_QUADS)
+        self._group.unset_state_recursive()
+
+    texture = property(lambda self: self._texture,
+                       doc='''Texture shared by the sprites.
+
+    :type: `Texture`
+    ''')
+
+def _as_array(ctypes_array):
+    # View of a vertex list attribute as a NumPy array. Fetching the
+    # attribute through the vertex list marks it for upload.
+    return numpy.ctypeslib.as_array(ctypes_array)
+
+class ArraySprite(object):
+    '''Handle to one sprite in a `SpriteArray`.
+
+    Setting a property writes into the arrays of the sprite array; the
+    vertices change on the next `SpriteArray.update`.
+    '''
+    __slots__ = 'array', 'index'
+
+    def __init__(self, array, index):
+        self.array = array
+        self.index = index
+
+    def delete(self):
+        '''Remove the sprite from its array.'''
+        self.array.remove(self.index)
+
+    def set_transform(self, x, y, rotation, scale):
+        '''Set the position, rotation and scale of the sprite at once.'''
+        array = self.array
+        array.positions[self.index] = x, y
+        array.rotations[self.index] = rotation
+        array.scales[self.index] = scale
+
+    def _set_image(self, img):
+        self.array.set_image(self.index, img)
+
+    image = property(lambda self: self.array._images[self.index], _set_image,
+                     doc='''Image to display, from the texture of the array.
+
+    :type: `AbstractImage`
+    ''')
+
+    def _set_visible(self, visible):
+        self.array.visible[self.index] = visible
+
+    visible = property(lambda self: bool(self.array.visible[self.index]),
+                       _set_visible,
+                       doc='''True if the sprite will be drawn.
+
+    :type: bool
+    ''')
+
+    def _set_position(self, position):
+        self.array.positions[self.index] = position
+
+    position = property(lambda self: tuple(self.array.positions[self.index]),
+                        _set_position,
+                        doc='''The (x, y) coordinates of the sprite.
+
+    :type: (float, float)
+    ''')
+
+    def _set_rotation(self, rotation):
+        self.array.rotations[self.index] = rotation
+
+    rotation = property(lambda self: self.array.rotations[self.index],
+                        _set_rotation,
+                        doc='''Clockwise rotation of the sprite, in degrees.
+
+    :type: float
+    ''')
+
+    def _set_scale(self, scale):
+        self.array.scales[self.index] = scale
+
+    scale = property(lambda self: self.array.scales[self.index], _set_scale,
+                     doc='''Scaling factor.
+
+    :type: float
+    ''')
+
+    def _set_color(self, rgb):
+        self.array.colors[self.index, :3] = rgb
+        self.array.colors_dirty = True
+
+    color = property(lambda self: tuple(self.array.colors[self.index, :3]),
+                     _set_color,
+                     doc='''Blend color.
+
+    :type: (int, int, int)
+    ''')
+
+    def _set_opacity(self, opacity):
+        self.array.colors[self.index, 3] = opacity
+        self.array.colors_dirty = True
+
+    opacity = property(lambda self: self.array.colors[self.index, 3],
+                       _set_opacity,
+                       doc='''Blend opacity.
+
+    :type: int
+    ''')
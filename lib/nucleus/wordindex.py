@@ -0,0 +1,628 @@
+from __future__ import with_statement
+
+import config
+from array import array
+from collections import *
+from itertools import *
+import hashlib
+from bisect import bisect_right
+from heapq import heapify, heappop, heappush, heapreplace
+import mmap
+import os
+import random
+import struct
+import time
+
+# The word index is a minimized DAWG (directed acyclic word graph) stored in
+# flat arrays. Node n owns the edges in the range
+# edge_offsets[n]:edge_offsets[n + 1]. Edge letters are alphabet indices
+# stored as a byte string, so that a child lookup is a bounded str.find.
+# Terminal nodes are marked by a bit in the terminals bit set. Node 0 is the
+# root.
+#
+# The same arrays are written to disk as a little-endian binary file that
+# is memory-mapped and queried in place:
+#
+#   header        magic, format version, word list checksum, sizes
+#   alphabet      UTF-8, padded to a multiple of four bytes
+#   letter counts uint32 per alphabet letter
+#   edge offsets  int32 * (node count + 1)
+#   edge targets  int32 * edge count
+#   edge letters  byte * edge count
+#   terminals     byte * ceil(node count / 8)
+
+# Bump when the file layout changes so that stale files are rebuilt.
+format_version = 1
+
+magic = 'NUCLEUSW'
+_header = struct.Struct('<8sI20sIII')
+_int32 = struct.Struct('<i')
+
+class WordIndex(object):
+    def __init__(self, words=(), alphabet=None, cache_size=None):
+        if alphabet is None:
+            alphabet = config.alphabet
+        if cache_size is None:
+            cache_size = config.completion_cache_size
+        self.alphabet = alphabet
+        self.letter_indices = dict((l, i) for i, l in enumerate(alphabet))
+        self._letter_codes = dict((l, chr(i)) for i, l in enumerate(alphabet))
+        self._code_letters = dict((chr(i), l) for i, l in enumerate(alphabet))
+        self.letter_counts = defaultdict(int)
+        self._letter_table = None
+        self._pending_words = []
+        if cache_size:
+            self.completion_cache = CompletionCache(cache_size)
+        else:
+            self.completion_cache = None
+        self._set_graph(*_flatten(_BuildNode()))
+        for word in words:
+            self.add_word(word)
+        self._finalize()
+
+    def _set_graph(self, edge_offsets, edge_letters, edge_targets, terminals):
+        self._edge_offsets = edge_offsets
+        self._edge_letters = edge_letters
+        self._edge_targets = edge_targets
+        self._terminals = terminals
+        self._next_letter_sets = {-1: frozenset()}
+        self._node_heights = None
+        if self.completion_cache is not None:
+            self.completion_cache.clear()
+
+    def add_word(self, word):
+        for letter in word:
+            if letter not in self.letter_indices:
+                raise ValueError('Letter not in alphabet: %r' % letter)
+        for letter in word:
+            self.letter_counts[letter] += 1
+        self._letter_table = None
+        self._pending_words.append(word)
+
+    def _finalize(self):
+        if self._pending_words:
+            words = set(self._iter_words())
+            words.update(self._pending_words)
+            self._pending_words = []
+            self._set_graph(*_build(words, self.letter_indices))
+
+    def words(self):
+        self._finalize()
+        return self._iter_words()
+
+    def _iter_words(self):
+        stack = [(0, u'')]
+        while stack:
+            node, prefix = stack.pop()
+            if self._is_terminal(node):
+                yield prefix
+            begin = self._edge_offsets[node]
+            end = self._edge_offsets[node + 1]
+            for i in xrange(end - 1, begin - 1, -1):
+                letter = self._code_letters[self._edge_letters[i]]
+                stack.append((self._edge_targets[i], prefix + letter))
+
+    @property
+    def node_count(self):
+        self._finalize()
+        return len(self._edge_offsets) - 1
+
+    def _is_terminal(self, node):
+        return ord(self._terminals[node >> 3]) & (1 << (node & 7))
+
+    def _child(self, node, letter):
+        code = self._letter_codes.get(letter)
+        if code is None:
+            return -1
+        i = self._edge_letters.find(code, self._edge_offsets[node],
+                                    self._edge_offsets[node + 1])
+        if i == -1:
+            return -1
+        return self._edge_targets[i]
+
+    def _next_letters(self, node):
+        letters = self._next_letter_sets.get(node)
+        if letters is None:
+            codes = self._edge_letters[self._edge_offsets[node]:
+                                       self._edge_offsets[node + 1]]
+            letters = frozenset(map(self._code_letters.__getitem__, codes))
+            self._next_letter_sets[node] = letters
+        return letters
+
+    def _find(self, prefix):
+        if self._pending_words:
+            self._finalize()
+        letter_codes = self._letter_codes
+        edge_offsets = self._edge_offsets
+        edge_letters = self._edge_letters
+        edge_targets = self._edge_targets
+        node = 0
+        for letter in prefix:
+            code = letter_codes.get(letter)
+            if code is None:
+                return -1
+            i = edge_letters.find(code, edge_offsets[node],
+                                  edge_offsets[node + 1])
+            if i == -1:
+                return -1
+            node = edge_targets[i]
+        return node
+
+    def complete(self, prefix):
+        if self._pending_words:
+            self._finalize()
+        cache = self.completion_cache
+        if cache is None:
+            return self._complete(prefix)
+        letters = cache.get(prefix)
+        if letters is None:
+            letters = self._complete(prefix)
+            cache.put(prefix, letters)
+        return letters
+
+    def _complete(self, prefix):
+        node = self._find(prefix)
+        if node == -1:
+            return frozenset()
+        letters = self._next_letters(node)
+        if ord(self._terminals[node >> 3]) & (1 << (node & 7)):
+            letters = letters | _empty_word
+        return letters
+
+    def cursor(self):
+        return WordCursor(self)
+
+    # The length of the longest word suffix below every node.
+    def _get_node_heights(self):
+        if self._node_heights is None:
+            edge_offsets = self._edge_offsets
+            edge_targets = self._edge_targets
+            heights = array('i', [-1]) * (len(edge_offsets) - 1)
+            stack = [0]
+            while stack:
+                node = stack[-1]
+                if heights[node] != -1:
+                    stack.pop()
+                    continue
+                children = [edge_targets[i]
+                            for i in xrange(edge_offsets[node],
+                                            edge_offsets[node + 1])]
+                pending = [c for c in children if heights[c] == -1]
+                if pending:
+                    stack.extend(pending)
+                else:
+                    stack.pop()
+                    heights[node] = max([heights[c] + 1 for c in children] or
+                                        [0])
+            self._node_heights = heights
+        return self._node_heights
+
+    # Finds the longest words that can be spelled with the given number of
+    # each alphabet letter, by a depth-first search of the word graph that
+    # only follows letters that are left. Branches that cannot beat the
+    # shortest of the best words so far are pruned, by the node heights and
+    # by the number of letters left. The search can be seeded with words
+    # known to be spellable, and restricted to words that use more of some
+    # letter than the required counts. Returns at most count words, longest
+    # first, and whether the search finished before the deadline.
+    def find_longest_words(self, letter_counts, count, words=(),
+                           required=None, deadline=None, timer=time.time):
+        self._finalize()
+        edge_offsets = self._edge_offsets
+        edge_letters = self._edge_letters
+        edge_targets = self._edge_targets
+        terminals = self._terminals
+        heights = self._get_node_heights()
+        alphabet = self.alphabet
+        counts = list(letter_counts)
+        seeds = set(words)
+        best = [(len(word), word) for word in seeds]
+        heapify(best)
+        while len(best) > count:
+            heappop(best)
+        prefix = []
+        visit_count = [0]
+
+        def search(node, remaining, extra):
+            depth = len(prefix)
+            if (depth and ord(terminals[node >> 3]) & (1 << (node & 7)) and
+                (required is None or extra)):
+                word = u''.join(alphabet[i] for i in prefix)
+                if word not in seeds:
+                    if len(best) < count:
+                        heappush(best, (depth, word))
+                    elif depth > best[0][0]:
+                        heapreplace(best, (depth, word))
+            if (len(best) >= count and
+                depth + min(heights[node], remaining) <= best[0][0]):
+                return
+            visit_count[0] += 1
+            if (deadline is not None and not visit_count[0] & 0x3ff and
+                timer() > deadline):
+                raise _SearchTimeout()
+            for i in xrange(edge_offsets[node], edge_offsets[node + 1]):
+                letter_index = ord(edge_letters[i])
+                if counts[letter_index]:
+                    counts[letter_index] -= 1
+                    prefix.append(letter_index)
+                    search(edge_targets[i], remaining - 1,
+                           extra or (required is not None and
+                                     letter_counts[letter_index] -
+                                     counts[letter_index] >
+                                     required[letter_index]))
+                    prefix.pop()
+                    counts[letter_index] += 1
+
+        complete = True
+        if count:
+            try:
+                search(0, sum(counts), False)
+            except _SearchTimeout:
+                complete = False
+        best.sort(key=lambda entry: (-entry[0], entry[1]))
+        return [word for _, word in best], complete
+
+    # Letters are drawn with the frequency they have in the word list, by
+    # bisecting a cumulative count table that is rebuilt after add_word.
+    def _get_letter_table(self):
+        if self._letter_table is None:
+            letters = []
+            cumulative_counts = []
+            total_count = 0
+            for letter in self.alphabet:
+                count = self.letter_counts.get(letter, 0)
+                if count:
+                    total_count += count
+                    letters.append(letter)
+                    cumulative_counts.append(total_count)
+            self._letter_table = letters, cumulative_counts
+        return self._letter_table
+
+    def random_letter(self, rng=random):
+        letters, cumulative_counts = self._get_letter_table()
+        if not letters:
+            return None
+        random_count = rng.random() * cumulative_counts[-1]
+        return letters[bisect_right(cumulative_counts, random_count)]
+
+    def random_letters(self, count, rng=random):
+        letters, cumulative_counts = self._get_letter_table()
+        if not letters:
+            return [None] * count
+        total_count = cumulative_counts[-1]
+        rand = rng.random
+        return [letters[bisect_right(cumulative_counts,
+                                     rand() * total_count)]
+                for _ in xrange(count)]
+
+    # Streams a word list into the index in one pass. Sorted words go
+    # straight into the automaton, and the few that are out of order are
+    # added afterwards. Words with letters outside the alphabet are skipped.
+    # The progress callback, if any, is called with the fraction of bytes
+    # parsed. Lines are split as bytes, so the encoding must encode newlines
+    # as single bytes, as ASCII, Latin-1 and UTF-8 do.
+    @staticmethod
+    def parse(path, encoding='ASCII', alphabet=None, progress=None):
+        word_index = WordIndex(alphabet=alphabet)
+        get_letter_index = word_index.letter_indices.__getitem__
+        letter_counts = [0] * len(word_index.alphabet)
+        unsorted_words = []
+        builder = _Builder()
+        total_size = max(os.path.getsize(path), 1)
+        size = 0
+        with open(path, 'rb') as file_obj:
+            for i, line in enumerate(file_obj):
+                size += len(line)
+                if progress is not None and not i & 0xfff:
+                    progress(float(size) / total_size)
+                word = line.decode(encoding).strip().upper()
+                if not word:
+                    continue
+                try:
+                    key = tuple(map(get_letter_index, word))
+                except KeyError:
+                    continue
+                if key > builder.previous:
+                    builder.add(key)
+                    for letter_index in key:
+                        letter_counts[letter_index] += 1
+                elif key != builder.previous:
+                    unsorted_words.append(word)
+        word_index._set_graph(*builder.finish())
+        for letter, count in izip(word_index.alphabet, letter_counts):
+            if count:
+                word_index.letter_counts[letter] = count
+        for word in unsorted_words:
+            word_index.add_word(word)
+        word_index._finalize()
+        if progress is not None:
+            progress(1.)
+        return word_index
+
+    @staticmethod
+    def load(path, checksum=None, alphabet=None):
+        if alphabet is None:
+            alphabet = config.alphabet
+        with open(path, 'rb') as word_index_file:
+            try:
+                data = mmap.mmap(word_index_file.fileno(), 0,
+                                 access=mmap.ACCESS_READ)
+            except (EnvironmentError, ValueError):
+                raise ValueError('Cannot map word index: %s' % path)
+        try:
+            (file_magic, file_version, file_checksum, alphabet_size,
+             node_count, edge_count) = _header.unpack_from(data)
+        except struct.error:
+            raise ValueError('Truncated word index: %s' % path)
+        if file_magic != magic or file_version != format_version:
+            raise ValueError('Stale word index: %s' % path)
+        offset = _header.size
+        try:
+            file_alphabet = data[offset:offset + alphabet_size].decode('UTF-8')
+        except UnicodeDecodeError:
+            raise ValueError('Corrupt word index: %s' % path)
+        offset += _padded(alphabet_size)
+        if (file_alphabet != alphabet or
+            (checksum is not None and file_checksum != checksum)):
+            raise ValueError('Stale word index: %s' % path)
+        terminals_size = (node_count + 7) // 8
+        file_size = (offset + 4 * len(alphabet) + 4 * (node_count + 1) +
+                     4 * edge_count + edge_count + terminals_size)
+        if len(data) != file_size:
+            raise ValueError('Truncated word index: %s' % path)
+        word_index = WordIndex(alphabet=alphabet)
+        for letter in alphabet:
+            count = _int32.unpack_from(data, offset)[0]
+            if count:
+                word_index.letter_counts[letter] = count
+            offset += 4
+        word_index._letter_table = None
+        edge_offsets = _Int32View(data, offset, node_count + 1)
+        offset += 4 * (node_count + 1)
+        edge_targets = _Int32View(data, offset, edge_count)
+        offset += 4 * edge_count
+        edge_letters = _BytesView(data, offset, edge_count)
+        offset += edge_count
+        terminals = _BytesView(data, offset, terminals_size)
+        word_index._set_graph(edge_offsets, edge_letters, edge_targets,
+                              terminals)
+        return word_index
+
+    def save(self, path, checksum=''):
+        self._finalize()
+        alphabet = self.alphabet.encode('UTF-8')
+        node_count = len(self._edge_offsets) - 1
+        edge_count = len(self._edge_targets)
+        with open(path, 'wb') as word_index_file:
+            word_index_file.write(_header.pack(magic, format_version,
+                                               checksum, len(alphabet),
+                                               node_count, edge_count))
+            word_index_file.write(alphabet.ljust(_padded(len(alphabet)),
+                                                 '\0'))
+            word_index_file.write(_pack_int32([self.letter_counts.get(l, 0)
+                                               for l in self.alphabet]))
+            word_index_file.write(_pack_int32(self._edge_offsets))
+            word_index_file.write(_pack_int32(self._edge_targets))
+            word_index_file.write(self._edge_letters[0:edge_count])
+            word_index_file.write(self._terminals[0:len(self._terminals)])
+
+_empty_word = frozenset([u''])
+
+class _SearchTimeout(Exception):
+    pass
+
+# Least recently used cache of completions, evicting beyond a fixed number of
+# prefixes. The counters tell whether the cache pays off. The game follows
+# the typed prefix with a WordCursor and never calls complete(), so the
+# cache is off by default. It is for callers that ask for the same prefix
+# many times in a row, where a hit on the most recent prefix skips
+# reordering the entries.
+class CompletionCache(object):
+    def __init__(self, size):
+        self.size = size
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._last_prefix = None
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, prefix):
+        letters = self._entries.get(prefix)
+        if letters is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+            if prefix != self._last_prefix:
+                del self._entries[prefix]
+                self._entries[prefix] = letters
+                self._last_prefix = prefix
+        return letters
+
+    def put(self, prefix, letters):
+        self._entries[prefix] = letters
+        self._last_prefix = prefix
+        if len(self._entries) > self.size:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def clear(self):
+        self._entries.clear()
+        self._last_prefix = None
+
+# A cursor follows a prefix through the word index one letter at a time. It
+# keeps the node for every prefix length, so that pushing or popping a letter
+# and the queries are constant time. Adding words to the index invalidates
+# its cursors.
+class WordCursor(object):
+    def __init__(self, word_index):
+        word_index._finalize()
+        self.word_index = word_index
+        self._nodes = [0]
+
+    def __len__(self):
+        return len(self._nodes) - 1
+
+    def push(self, letter):
+        node = self._nodes[-1]
+        if node != -1:
+            node = self.word_index._child(node, letter)
+        self._nodes.append(node)
+
+    def pop(self):
+        if len(self._nodes) > 1:
+            self._nodes.pop()
+
+    def clear(self):
+        del self._nodes[1:]
+
+    def reset(self, letters):
+        self.clear()
+        for letter in letters:
+            self.push(letter)
+
+    def is_prefix(self):
+        return self._nodes[-1] != -1
+
+    def is_word(self):
+        node = self._nodes[-1]
+        return node != -1 and bool(self.word_index._is_terminal(node))
+
+    def next_letters(self):
+        return self.word_index._next_letters(self._nodes[-1])
+
+def word_list_checksum(path):
+    digest = hashlib.sha1()
+    with open(path, 'rb') as word_list_file:
+        for chunk in iter(lambda: word_list_file.read(65536), ''):
+            digest.update(chunk)
+    return digest.digest()
+
+def _padded(size):
+    return (size + 3) & ~3
+
+def _pack_int32(values):
+    count = len(values)
+    return struct.pack('<%di' % count, *[values[i] for i in xrange(count)])
+
+# Read-only views of a memory-mapped word index. They support the subset of
+# the array and str interfaces that WordIndex uses.
+class _Int32View(object):
+    __slots__ = '_buffer', '_offset', '_count'
+
+    def __init__(self, buffer, offset, count):
+        self._buffer = buffer
+        self._offset = offset
+        self._count = count
+
+    def __len__(self):
+        return self._count
+
+    def __getitem__(self, i):
+        return _int32.unpack_from(self._buffer, self._offset + 4 * i)[0]
+
+class _BytesView(object):
+    __slots__ = '_buffer', '_offset', '_size'
+
+    def __init__(self, buffer, offset, size):
+        self._buffer = buffer
+        self._offset = offset
+        self._size = size
+
+    def __len__(self):
+        return self._size
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            start, stop, _ = i.indices(self._size)
+            return self._buffer[self._offset + start:self._offset + stop]
+        return self._buffer[self._offset + i]
+
+    def find(self, sub, start, end):
+        i = self._buffer.find(sub, self._offset + start, self._offset + end)
+        if i == -1:
+            return -1
+        return i - self._offset
+
+class _BuildNode(object):
+    __slots__ = 'terminal', 'children'
+
+    def __init__(self):
+        self.terminal = False
+        self.children = []
+
+    def key(self):
+        return self.terminal, tuple((i, id(c)) for i, c in self.children)
+
+def _build(words, letter_indices):
+    builder = _Builder()
+    for word in sorted(tuple(letter_indices[l] for l in word)
+                       for word in words):
+        if word != builder.previous:
+            builder.add(word)
+    return builder.finish()
+
+# Incremental construction of a minimal acyclic automaton from sorted input,
+# after Daciuk et al. Only the path of the previous word is left unminimized.
+# Words are tuples of alphabet indices, and each must sort after the
+# previous one.
+class _Builder(object):
+    def __init__(self):
+        self.register = {}
+        self.root = _BuildNode()
+        self.path = [self.root]
+        self.previous = ()
+
+    def add(self, word):
+        common = 0
+        for a, b in izip(word, self.previous):
+            if a != b:
+                break
+            common += 1
+        _minimize(self.path, common, self.register)
+        node = self.path[-1]
+        for letter_index in word[common:]:
+            child = _BuildNode()
+            node.children.append((letter_index, child))
+            self.path.append(child)
+            node = child
+        node.terminal = True
+        self.previous = word
+
+    def finish(self):
+        _minimize(self.path, 0, self.register)
+        return _flatten(self.root)
+
+def _minimize(path, common, register):
+    while len(path) > common + 1:
+        node = path.pop()
+        key = node.key()
+        if key in register:
+            parent = path[-1]
+            letter_index, _ = parent.children[-1]
+            parent.children[-1] = letter_index, register[key]
+        else:
+            register[key] = node
+
+def _flatten(root):
+    numbers = {id(root): 0}
+    nodes = [root]
+    for node in nodes:
+        for _, child in node.children:
+            if id(child) not in numbers:
+                numbers[id(child)] = len(nodes)
+                nodes.append(child)
+    edge_offsets = array('i', [0])
+    edge_letters = []
+    edge_targets = array('i')
+    terminals = bytearray((len(nodes) + 7) // 8)
+    for n, node in enumerate(nodes):
+        for letter_index, child in node.children:
+            edge_letters.append(chr(letter_index))
+            edge_targets.append(numbers[id(child)])
+        edge_offsets.append(len(edge_targets))
+        if node.terminal:
+            terminals[n >> 3] |= 1 << (n & 7)
+    return edge_offsets, ''.join(edge_letters), edge_targets, str(terminals)
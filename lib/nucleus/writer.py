@@ -0,0 +1,80 @@
+from __future__ import with_statement
+
+from collections import *
+import os
+import Queue
+import sys
+import threading
+import time
+
+# Writes files on a background thread, so that encoding and slow storage
+# cannot stall the main loop. A job is a path and a function that writes the
+# contents to an open file, with everything it needs captured up front. Jobs
+# are written in the order they were queued. Pending counts the jobs that are
+# queued or being written, and finished jobs are kept with the time they
+# waited and the time they took to write, until the main thread collects
+# them.
+
+class FileWriter(object):
+    def __init__(self):
+        self.pending = 0
+        self._jobs = Queue.Queue()
+        self._lock = threading.Lock()
+        self._completed = deque()
+        self._thread = threading.Thread(target=self._run)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def write(self, path, write):
+        with self._lock:
+            self.pending += 1
+        self._jobs.put((path, write, time.time()))
+
+    # Returns the jobs finished since the last call, as tuples of path, wait
+    # time, write time and the exception, if the write failed.
+    def pop_completed(self):
+        completed = []
+        while self._completed:
+            completed.append(self._completed.popleft())
+        return completed
+
+    # Waits for the queued jobs to be written.
+    def close(self):
+        self._jobs.put(None)
+        self._thread.join()
+
+    def _run(self):
+        while True:
+            job = self._jobs.get()
+            if job is None:
+                break
+            path, write, queue_time = job
+            start = time.time()
+            error = None
+            try:
+                write_atomically(path, write)
+            except Exception, e:
+                error = e
+            self._completed.append((path, start - queue_time,
+                                    time.time() - start, error))
+            with self._lock:
+                self.pending -= 1
+
+# Writes to a temporary file next to the destination and renames it over the
+# destination when complete, so that a crash or a full disk leaves the old
+# file intact.
+def write_atomically(path, write):
+    temp_path = path + '.tmp'
+    try:
+        with open(temp_path, 'wb') as temp_file:
+            write(temp_file)
+            temp_file.flush()
+            os.fsync(temp_file.fileno())
+        if sys.platform == 'win32' and os.path.exists(path):
+            # Windows cannot rename over an existing file.
+            os.remove(path)
+        os.rename(temp_path, path)
+    except:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise